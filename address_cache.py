@@ -0,0 +1,153 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value) -> int:
+    """Approximate memory footprint of a cached value by its compact JSON size"""
+    try:
+        return len(json.dumps(value, separators=(',', ':'), default=list))
+    except (TypeError, ValueError):
+        return 0
+
+
+class AddressCache:
+    """Bounded LRU/TTL cache of address lookups with request coalescing
+
+    Entries are evicted least-recently-used first once either `max_entries`
+    or `max_bytes` is exceeded. Addresses with unconfirmed (mempool) activity
+    expire after `mempool_ttl`, everything else after `confirmed_ttl`.
+    Concurrent lookups of the same address share one fetch.
+
+    With a `shared` StateBackend, a local miss first looks for an entry
+    another process fetched, and every fetch is offered back to it.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, confirmed_ttl: float, mempool_ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.confirmed_ttl = confirmed_ttl
+        self.mempool_ttl = mempool_ttl
+        self.entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.inflight = {}
+        self.total_bytes = 0
+        self.shared = None
+        self.stats = {
+            'hits': 0, 'misses': 0, 'coalesced': 0, 'bypassed': 0, 'evictions': 0, 'expirations': 0, 'shared_hits': 0
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def ttl_for(self, value) -> float:
+        """Short TTL while the address has mempool activity or data is partial"""
+        mempool_txs = value.get('address_data', {}).get('mempool_stats', {}).get('tx_count', 0)
+        if mempool_txs or value.get('partial'):
+            return self.mempool_ttl
+        return self.confirmed_ttl
+
+    def get(self, key):
+        """Return a live cached value (refreshing its LRU position) or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.stats['expirations'] += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, ttl: float = None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + (self.ttl_for(value) if ttl is None else ttl), size, value)
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, key):
+        if key in self.entries:
+            self._remove(key)
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+    async def get_or_fetch(self, key, fetcher, bypass: bool = False):
+        """Serve `key` from cache, or fetch it once for all concurrent callers
+
+        With `bypass` the cached entry is ignored and replaced by a new fetch,
+        though an already running fetch is still joined since it is fresh.
+        """
+        if bypass:
+            self.stats['bypassed'] += 1
+        else:
+            value = self.get(key)
+            if value is not None:
+                self.stats['hits'] += 1
+                return value
+
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(inflight)
+
+        if not bypass:
+            self.stats['misses'] += 1
+        future = asyncio.ensure_future(self._fetch(key, fetcher, bypass))
+        self.inflight[key] = future
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key, fetcher, bypass: bool = False):
+        try:
+            if self.shared is not None and not bypass:
+                try:
+                    cached = await self.shared.load_cached(key)
+                except Exception as e:
+                    print(f"Error reading shared cache entry {key}: {e}")
+                    cached = None
+                if cached is not None:
+                    value, expires_at = cached
+                    self.stats['shared_hits'] += 1
+                    self.put(key, value, ttl=expires_at - time.time())
+                    return value
+            value = await fetcher()
+            if value is not None:
+                self.put(key, value)
+                if self.shared is not None:
+                    self.shared.store_cached(key, value, time.time() + self.ttl_for(value))
+            return value
+        finally:
+            self.inflight.pop(key, None)
+
+    def snapshot(self) -> list:
+        """Live entries as [address, seconds_left, value], oldest first"""
+        now = time.monotonic()
+        return [
+            [key, expires_at - now, value]
+            for key, (expires_at, _, value) in self.entries.items()
+            if expires_at > now
+        ]
+
+    def restore(self, items: list, elapsed: float = 0.0):
+        """Reload a snapshot taken `elapsed` seconds ago; entries fetched since startup are kept"""
+        now = time.monotonic()
+        for key, seconds_left, value in items:
+            seconds_left -= elapsed
+            if seconds_left <= 0 or key in self.entries:
+                continue
+            self.put(key, value)
+            if key in self.entries:
+                _, size, value = self.entries[key]
+                self.entries[key] = (now + seconds_left, size, value)
+
+    def summary(self) -> dict:
+        return dict(self.stats, entries=len(self.entries), bytes=self.total_bytes)
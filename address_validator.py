@@ -0,0 +1,196 @@
+import hashlib
+from functools import lru_cache
+from typing import NamedTuple
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BASE58_INDEX = {char: index for index, char in enumerate(BASE58_ALPHABET)}
+
+BECH32_ALPHABET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BECH32_INDEX = {char: index for index, char in enumerate(BECH32_ALPHABET)}
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+
+# Base58Check version byte -> (network, address type)
+BASE58_VERSIONS = {
+    0x00: ('mainnet', 'p2pkh'),
+    0x05: ('mainnet', 'p2sh'),
+    0x6f: ('testnet', 'p2pkh'),
+    0xc4: ('testnet', 'p2sh'),
+}
+
+# Bech32 human-readable part -> network
+BECH32_NETWORKS = {
+    'bc': 'mainnet',
+    'tb': 'testnet',
+    'bcrt': 'regtest',
+}
+
+
+class InvalidAddressError(ValueError):
+    """Raised when text is not a valid Bitcoin address"""
+
+
+class BitcoinAddress(NamedTuple):
+    """A validated address in canonical form"""
+    address: str
+    network: str
+    type: str
+    cache_key: str
+
+
+def _sha256d(data: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def decode_base58check(text: str) -> bytes:
+    """Decode Base58Check text and return the payload (version byte included)"""
+    number = 0
+    for char in text:
+        digit = BASE58_INDEX.get(char)
+        if digit is None:
+            raise InvalidAddressError(f"invalid Base58 character {char!r}")
+        number = number * 58 + digit
+
+    leading_zeros = len(text) - len(text.lstrip('1'))
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    raw = b'\x00' * leading_zeros + raw
+    if len(raw) < 5:
+        raise InvalidAddressError("too short")
+
+    payload, checksum = raw[:-4], raw[-4:]
+    if _sha256d(payload)[:4] != checksum:
+        raise InvalidAddressError("checksum mismatch")
+    return payload
+
+
+def encode_base58check(payload: bytes) -> str:
+    raw = payload + _sha256d(payload)[:4]
+    number = int.from_bytes(raw, 'big')
+    chars = []
+    while number:
+        number, digit = divmod(number, 58)
+        chars.append(BASE58_ALPHABET[digit])
+    leading_zeros = len(raw) - len(raw.lstrip(b'\x00'))
+    return '1' * leading_zeros + ''.join(reversed(chars))
+
+
+def _bech32_polymod(values) -> int:
+    generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            if (top >> i) & 1:
+                checksum ^= generator[i]
+    return checksum
+
+
+def _hrp_expand(hrp: str) -> list:
+    return [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+
+
+def _convert_bits(data, from_bits: int, to_bits: int, pad: bool) -> list:
+    accumulator = 0
+    bits = 0
+    result = []
+    max_value = (1 << to_bits) - 1
+    for value in data:
+        accumulator = (accumulator << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            result.append((accumulator >> bits) & max_value)
+    if pad:
+        if bits:
+            result.append((accumulator << (to_bits - bits)) & max_value)
+    elif bits >= from_bits or ((accumulator << (to_bits - bits)) & max_value):
+        raise InvalidAddressError("invalid witness program padding")
+    return result
+
+
+def decode_segwit(text: str):
+    """Decode a Bech32/Bech32m SegWit address into (hrp, witness version, program)"""
+    if text.lower() != text and text.upper() != text:
+        raise InvalidAddressError("mixed case")
+    text = text.lower()
+    separator = text.rfind('1')
+    if separator < 1 or separator + 7 > len(text) or len(text) > 90:
+        raise InvalidAddressError("invalid Bech32 length or separator")
+
+    hrp = text[:separator]
+    data = []
+    for char in text[separator + 1:]:
+        value = BECH32_INDEX.get(char)
+        if value is None:
+            raise InvalidAddressError(f"invalid Bech32 character {char!r}")
+        data.append(value)
+
+    constant = _bech32_polymod(_hrp_expand(hrp) + data)
+    if constant not in (BECH32_CONST, BECH32M_CONST):
+        raise InvalidAddressError("checksum mismatch")
+
+    data = data[:-6]
+    if not data:
+        raise InvalidAddressError("missing witness version")
+    version = data[0]
+    if version > 16:
+        raise InvalidAddressError("invalid witness version")
+    # BIP-350: version 0 uses Bech32, versions 1+ use Bech32m
+    if (version == 0) != (constant == BECH32_CONST):
+        raise InvalidAddressError("wrong checksum variant for witness version")
+
+    program = bytes(_convert_bits(data[1:], 5, 8, False))
+    if not 2 <= len(program) <= 40:
+        raise InvalidAddressError("invalid witness program length")
+    if version == 0 and len(program) not in (20, 32):
+        raise InvalidAddressError("invalid witness v0 program length")
+    return hrp, version, program
+
+
+def encode_segwit(hrp: str, version: int, program: bytes) -> str:
+    data = [version] + _convert_bits(program, 8, 5, True)
+    constant = BECH32_CONST if version == 0 else BECH32M_CONST
+    polymod = _bech32_polymod(_hrp_expand(hrp) + data + [0] * 6) ^ constant
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(BECH32_ALPHABET[value] for value in data + checksum)
+
+
+@lru_cache(maxsize=8192)
+def validate_address(text: str) -> BitcoinAddress:
+    """Validate and normalize a Bitcoin address, or raise InvalidAddressError
+
+    Checks Base58Check and Bech32/Bech32m checksums locally, detects the
+    network and address type, and lower-cases Bech32 addresses so the same
+    address always maps to the same cache key.
+    """
+    text = text.strip()
+    if not 14 <= len(text) <= 90:
+        raise InvalidAddressError("invalid length")
+
+    separator = text.rfind('1')
+    if separator > 0 and text[:separator].lower() in BECH32_NETWORKS:
+        hrp, version, program = decode_segwit(text)
+        network = BECH32_NETWORKS[hrp]
+        if version == 0:
+            address_type = 'p2wpkh' if len(program) == 20 else 'p2wsh'
+        elif version == 1 and len(program) == 32:
+            address_type = 'p2tr'
+        else:
+            address_type = f'witness_v{version}'
+        canonical = text.lower()
+    else:
+        payload = decode_base58check(text)
+        if len(payload) != 21 or payload[0] not in BASE58_VERSIONS:
+            raise InvalidAddressError("unknown address version")
+        network, address_type = BASE58_VERSIONS[payload[0]]
+        canonical = text
+
+    return BitcoinAddress(canonical, network, address_type, f"{network}:{canonical}")
+
+
+def is_valid_address(text: str, network: str = 'mainnet') -> bool:
+    try:
+        return validate_address(text).network == network
+    except InvalidAddressError:
+        return False
@@ -0,0 +1,48 @@
+import asyncio
+from collections import defaultdict
+
+
+class BoundedScheduler:
+    """Runs jobs under a global concurrency cap and a cap per upstream host
+
+    One scheduler is shared by every batch, so several users running
+    batches at once still cannot exceed the limits together.
+    """
+
+    def __init__(self, concurrency: int, per_host: int):
+        self.global_slots = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.host_slots = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        self.stats = {'started': 0, 'completed': 0, 'failed': 0, 'running': 0}
+
+    async def run(self, host: str, job):
+        """Await `job()` once both a host slot and a global slot are free"""
+        async with self.host_slots[host]:
+            async with self.global_slots:
+                self.stats['started'] += 1
+                self.stats['running'] += 1
+                try:
+                    result = await job()
+                except Exception:
+                    self.stats['failed'] += 1
+                    raise
+                finally:
+                    self.stats['running'] -= 1
+                self.stats['completed'] += 1
+                return result
+
+    async def stream(self, jobs: list):
+        """Run (key, host, job) triples and yield (key, result, error) as each finishes"""
+        async def keyed(key, host, job):
+            try:
+                return key, await self.run(host, job), None
+            except Exception as e:
+                return key, None, e
+
+        tasks = [asyncio.ensure_future(keyed(key, host, job)) for key, host, job in jobs]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,69 @@
+"""Measure local address validation cost over a mix of address types
+
+    python benchmarks/bench_address_validation.py [num_addresses]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import address_validator  # noqa: E402
+from address_validator import InvalidAddressError, encode_base58check, encode_segwit  # noqa: E402
+
+
+def synthetic_addresses(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    makers = [
+        lambda: encode_base58check(b'\x00' + rng.randbytes(20)),
+        lambda: encode_base58check(b'\x05' + rng.randbytes(20)),
+        lambda: encode_segwit('bc', 0, rng.randbytes(20)),
+        lambda: encode_segwit('bc', 0, rng.randbytes(32)),
+        lambda: encode_segwit('bc', 1, rng.randbytes(32)),
+    ]
+    addresses = [rng.choice(makers)() for _ in range(count)]
+    # One in ten gets a typo, which must be rejected by the checksum
+    for i in range(0, count, 10):
+        address = addresses[i]
+        position = rng.randrange(4, len(address))
+        replacement = 'q' if address[position] != 'q' else 'p'
+        addresses[i] = address[:position] + replacement + address[position + 1:]
+    return addresses
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    addresses = synthetic_addresses(count)
+    validate = address_validator.validate_address.__wrapped__
+
+    started = time.perf_counter()
+    rejected = 0
+    for address in addresses:
+        try:
+            validate(address)
+        except InvalidAddressError:
+            rejected += 1
+    elapsed = time.perf_counter() - started
+
+    cached = address_validator.validate_address
+    for address in addresses[:8192]:
+        try:
+            cached(address)
+        except InvalidAddressError:
+            pass
+    started = time.perf_counter()
+    for address in addresses[:8192]:
+        try:
+            cached(address)
+        except InvalidAddressError:
+            pass
+    cached_elapsed = time.perf_counter() - started
+
+    print(f"{count:,} addresses, {rejected:,} rejected")
+    print(f"  uncached  {elapsed:.3f} s total, {elapsed / count * 1e6:.1f} µs per address")
+    print(f"  cached    {cached_elapsed / 8192 * 1e6:.2f} µs per address (repeat lookups, valid ones only cached)")
+
+
+if __name__ == '__main__':
+    main()
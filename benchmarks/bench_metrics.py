@@ -0,0 +1,59 @@
+"""Measure the per-call cost of the metrics layer on the analysis hot path
+
+    python benchmarks/bench_metrics.py [iterations]
+
+A single-address analysis records about ten stage timings and a few
+counter increments; the cost is compared with a 100 ms analysis, which is
+well below what a cached answer plus one Telegram edit takes in practice.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Registry  # noqa: E402
+
+STAGES = ('rate_limit', 'validation', 'telegram_reply', 'price', 'address_info', 'formatting', 'telegram_edit')
+ANALYSIS_SECONDS = 0.1
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    registry = Registry()
+    stages = registry.histogram('bench_stage_seconds', 'bench', ('stage',))
+    outcomes = registry.counter('bench_outcomes_total', 'bench', ('outcome',))
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        stages.observe(0.01 * (i % 7), 'formatting')
+    observe_cost = (time.perf_counter() - started) / iterations
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with stages.time('validation'):
+            pass
+    timer_cost = (time.perf_counter() - started) / iterations
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        outcomes.inc('ok')
+    counter_cost = (time.perf_counter() - started) / iterations
+
+    per_analysis = len(STAGES) * timer_cost + 2 * observe_cost + 2 * counter_cost
+
+    for stage in STAGES:
+        stages.observe(0.01, stage)
+    started = time.perf_counter()
+    text = registry.render()
+    render_cost = time.perf_counter() - started
+
+    print(f"observe      {observe_cost * 1e9:.0f} ns")
+    print(f"time() block {timer_cost * 1e9:.0f} ns")
+    print(f"counter inc  {counter_cost * 1e9:.0f} ns")
+    print(f"per analysis {per_analysis * 1e6:.1f} µs = {per_analysis / ANALYSIS_SECONDS:.4%} of a {ANALYSIS_SECONDS * 1000:.0f} ms analysis")
+    print(f"render       {render_cost * 1000:.2f} ms for {len(text.splitlines())} lines")
+
+
+if __name__ == '__main__':
+    main()
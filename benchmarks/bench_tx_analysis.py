@@ -0,0 +1,102 @@
+"""Compare net_flows() and the columnar TxBatch with the original per-tx loop
+
+    python benchmarks/bench_tx_analysis.py [num_transactions]
+
+net_flows() is what an analysis calls and is timed end to end. TxBatch
+timings are split into the flatten step and the queries on a built batch,
+which only matter when one batch is queried more than once.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tx_analysis  # noqa: E402
+
+TARGET = "bc1qzv7v3kengms6zguh7445xxy77dsrwjqxxrcxrt"
+
+
+def synthetic_transactions(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    pool = [f"bc1qsynthetic{i:030d}" for i in range(2000)] + [TARGET]
+
+    def entry():
+        return {'scriptpubkey_address': rng.choice(pool), 'value': rng.randrange(1, 10 ** 8)}
+
+    return [
+        {
+            'txid': f"{i:064x}",
+            'vin': [{'prevout': entry()} for _ in range(rng.randint(1, 4))],
+            'vout': [entry() for _ in range(rng.randint(1, 4))],
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_net_flows(transactions: list, address: str) -> list:
+    """The loop analyze_address used before tx_analysis existed"""
+    flows = []
+    for tx in transactions:
+        value_received = 0
+        for vout in tx['vout']:
+            addr_list = vout.get('scriptpubkey_address', [])
+            if isinstance(addr_list, str):
+                addr_list = [addr_list]
+            elif addr_list is None:
+                addr_list = []
+            if address in addr_list:
+                value_received += vout['value']
+
+        value_sent = 0
+        for vin in tx['vin']:
+            prevout = vin.get('prevout', {})
+            if prevout:
+                prev_addr = prevout.get('scriptpubkey_address')
+                if isinstance(prev_addr, str):
+                    prev_addr_list = [prev_addr]
+                elif isinstance(prev_addr, list):
+                    prev_addr_list = prev_addr
+                else:
+                    prev_addr_list = []
+                if address in prev_addr_list:
+                    value_sent += prevout.get('value', 0)
+
+        flows.append((value_received, value_sent, value_received - value_sent))
+    return flows
+
+
+def best_of(func, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    transactions = synthetic_transactions(count)
+    batch = tx_analysis.TxBatch.from_transactions(transactions)
+
+    expected = legacy_net_flows(transactions, TARGET)
+    assert tx_analysis.net_flows(transactions, TARGET) == expected
+    assert batch.flows_for(TARGET) == expected
+
+    legacy = best_of(lambda: legacy_net_flows(transactions, TARGET))
+    end_to_end = best_of(lambda: tx_analysis.net_flows(transactions, TARGET))
+    flatten = best_of(lambda: tx_analysis.TxBatch.from_transactions(transactions))
+    per_tx = best_of(lambda: batch.flows_for(TARGET))
+    per_address = best_of(lambda: batch.flows_by_address())
+
+    print(f"{count:,} transactions, numpy={'yes' if tx_analysis.load_numpy() is not None else 'no'}")
+    print(f"  legacy loop, one address      {legacy * 1000:9.2f} ms")
+    print(f"  net_flows(), one address      {end_to_end * 1000:9.2f} ms  ({legacy / end_to_end:.1f}x)")
+    print(f"  TxBatch flatten to columns    {flatten * 1000:9.2f} ms")
+    print(f"  TxBatch flows, one address    {per_tx * 1000:9.2f} ms  (batch already built)")
+    print(f"  TxBatch flows, all addresses  {per_address * 1000:9.2f} ms  ({len(batch.addresses):,} addresses)")
+
+if __name__ == '__main__':
+    main()
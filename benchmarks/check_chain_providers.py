@@ -0,0 +1,204 @@
+"""Check the chain provider pool's circuit breaker and failover behaviour
+
+    python benchmarks/check_chain_providers.py [--port 18760]
+
+Two local aiohttp stubs stand in for a primary and a fallback Esplora API
+(on --port and the next port); each scenario sets how they answer and runs
+against a fresh ProviderPool. Covered: failover on 5xx, a hedge to the
+fallback when the primary is slow, the breaker opening and closing again
+after a successful probe, and a probe abandoned by its caller, either while
+in flight or while still waiting for an outbound token. Prints one line per
+check and exits 1 if any of them fails.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+from chain_providers import HEDGE_MIN_SAMPLES, ProviderPool, UpstreamUnavailable  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+from outbound_scheduler import SchedulerBusy, outbound  # noqa: E402
+
+
+class EsploraStub:
+    """Answers every GET with its own name, after `delay` seconds, with HTTP `status`"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status = 200
+        self.delay = 0.0
+        self.hits = 0
+
+    def reset(self, status: int = 200, delay: float = 0.0):
+        self.status = status
+        self.delay = delay
+        self.hits = 0
+
+    async def handle(self, request):
+        self.hits += 1
+        await asyncio.sleep(self.delay)
+        return web.Response(status=self.status, text=self.name)
+
+    async def serve(self, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        return runner
+
+
+async def read_text(response):
+    return await response.text()
+
+
+def half_open_due(pool: ProviderPool):
+    """Put the primary's breaker where the next request is its half-open probe"""
+    breaker = pool.providers[0].breaker
+    breaker.state = 'open'
+    breaker.opened_at = time.monotonic() - breaker.cooldown
+
+
+async def failover_on_5xx(primary, fallback, pool):
+    """A 5xx from the primary is retried on the fallback"""
+    primary.reset(status=500)
+    result = await pool.request('check', '/', read_text)
+    assert result == 'fallback', f"got {result!r}"
+    assert primary.hits == 1 and fallback.hits == 1, f"hits {primary.hits}/{fallback.hits}"
+    assert pool.stats['retries'] == 1, f"stats {pool.stats}"
+
+
+async def hedge_on_slow_primary(primary, fallback, pool):
+    """A primary slower than its p95 gets a hedged copy on the fallback, which wins"""
+    pool.providers[0].latencies.extend([0.01] * HEDGE_MIN_SAMPLES)
+    primary.reset(delay=2.0)
+    started = time.monotonic()
+    result = await pool.request('check', '/', read_text)
+    elapsed = time.monotonic() - started
+    assert result == 'fallback', f"got {result!r}"
+    assert pool.stats['hedges'] == 1, f"stats {pool.stats}"
+    assert elapsed < 1.0, f"answered after {elapsed:.2f}s"
+    assert pool.providers[0].breaker.state == 'closed', "a lost hedge counted as a failure"
+
+
+async def breaker_opens_and_recovers(primary, fallback, pool):
+    """Consecutive failures open the primary's breaker; one good probe closes it"""
+    breaker = pool.providers[0].breaker
+    breaker.cooldown = 0.2
+    primary.reset(status=503)
+    for _ in range(breaker.failure_threshold):
+        assert await pool.request('check', '/', read_text) == 'fallback'
+    assert breaker.state == 'open', f"breaker {breaker.state} after {breaker.failures} failures"
+
+    hits = primary.hits
+    assert await pool.request('check', '/', read_text) == 'fallback'
+    assert primary.hits == hits, "an open breaker still sent traffic"
+
+    primary.reset()
+    await asyncio.sleep(breaker.cooldown)
+    result = await pool.request('check', '/', read_text)
+    assert result == 'primary', f"probe answered by {result!r}"
+    assert breaker.state == 'closed' and not breaker.probing, f"breaker {breaker.state} after the probe"
+
+
+async def cancelled_mid_probe(primary, fallback, pool):
+    """A caller cancelled while its probe is in flight hands the probe back"""
+    half_open_due(pool)
+    primary.reset(delay=2.0)
+    task = asyncio.ensure_future(pool.request('check', '/', read_text))
+    await asyncio.sleep(0.1)
+    breaker = pool.providers[0].breaker
+    assert primary.hits == 1 and breaker.probing, "the probe was not in flight"
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert not breaker.probing, "probe still claimed after the caller was cancelled"
+
+    primary.reset()
+    result = await pool.request('check', '/', read_text)
+    assert result == 'primary', f"next probe answered by {result!r}"
+    assert breaker.state == 'closed', f"breaker {breaker.state}"
+
+
+async def cancelled_while_queued(primary, fallback, pool):
+    """A probe cancelled while it waits for an outbound token hands the probe back"""
+    half_open_due(pool)
+    outbound.configure_host(pool.providers[0].host, 0.001, 1)
+    outbound.bucket(pool.providers[0].host).tokens = 0
+
+    task = asyncio.ensure_future(pool.request('probe', '/', read_text))
+    await asyncio.sleep(0.05)
+    breaker = pool.providers[0].breaker
+    assert breaker.probing, "the request should have claimed the probe"
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert not breaker.probing, "probe still claimed after the caller was cancelled"
+    assert breaker.available(), "breaker refuses the next probe"
+
+
+async def shed_while_probing(primary, fallback, pool):
+    """A probe shed by a full outbound queue hands the probe back and is not a provider failure"""
+    half_open_due(pool)
+    outbound.configure_host(pool.providers[0].host, 0.001, 1)
+    bucket = outbound.bucket(pool.providers[0].host)
+    bucket.tokens = 0
+    bucket.max_queue = 0
+
+    try:
+        await pool.request('probe', '/', read_text)
+    except SchedulerBusy:
+        pass
+    else:
+        raise AssertionError("expected SchedulerBusy")
+    breaker = pool.providers[0].breaker
+    assert not breaker.probing, "probe still claimed after the request was shed"
+    assert breaker.state == 'half_open', f"breaker went {breaker.state}"
+    try:
+        await asyncio.wait_for(pool.request('probe', '/', read_text), 0.05)
+    except UpstreamUnavailable as e:
+        raise AssertionError(f"next request failed fast: {e}")
+    except (SchedulerBusy, asyncio.TimeoutError):
+        pass
+
+
+CHECKS = [
+    failover_on_5xx, hedge_on_slow_primary, breaker_opens_and_recovers,
+    cancelled_mid_probe, cancelled_while_queued, shed_while_probing
+]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=18760, help='primary stub port; the fallback uses the next one')
+    args = parser.parse_args()
+
+    primary, fallback = EsploraStub('primary'), EsploraStub('fallback')
+    runners = [await primary.serve(args.port), await fallback.serve(args.port + 1)]
+    failed = 0
+    try:
+        for check in CHECKS:
+            primary.reset()
+            fallback.reset()
+            pool = ProviderPool([f"http://127.0.0.1:{args.port}", f"http://127.0.0.1:{args.port + 1}"])
+            for provider in pool.providers:
+                outbound.configure_host(provider.host, 1000, 100)
+            try:
+                await check(primary, fallback, pool)
+            except AssertionError as e:
+                failed += 1
+                print(f"FAIL {check.__name__}: {e}")
+            else:
+                print(f"ok   {check.__name__}")
+    finally:
+        await HttpClient.close()
+        for runner in runners:
+            await runner.cleanup()
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -0,0 +1,156 @@
+"""Measure the bot's cold start: process start to the first answered update
+
+    python benchmarks/cold_start.py [--runs 5] [--mode webhook|polling]
+
+Starts the Telegram stub (benchmarks/telegram_stub.py) in this process and
+launches bot.py as a fresh process pointed at it. A /start update is then
+delivered as soon as the stub sees the bot ask for updates, which is
+setWebhook in webhook mode and getUpdates when polling. The clock stops
+when the stub receives the bot's reply. Upstream APIs point at a closed
+port, so chain and price warm-up fail fast instead of reaching the network.
+--telegram-latency-ms adds a round trip to every Bot API call, and
+--cached-addresses saves an address cache snapshot for the bot to restore.
+
+Each run reports the wall time to the reply and the bot's own startup
+phases from /stats (seconds after its process started): imported,
+listening, ready, first_update and warm.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from state_store import SQLiteBackend  # noqa: E402
+from telegram_stub import TelegramStub, message_update  # noqa: E402
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot.py')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--mode', choices=('webhook', 'polling'), default='webhook')
+    parser.add_argument('--telegram-latency-ms', type=float, default=0, help='delay of every Telegram stub answer')
+    parser.add_argument('--cached-addresses', type=int, default=0, help='address cache entries in the saved state')
+    parser.add_argument('--port', type=int, default=18750, help='stub port; the bot uses the next one')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    return parser.parse_args()
+
+
+async def wait_for(predicate, timeout: float = 30, interval: float = 0.005):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("bot did not get there in time")
+        await asyncio.sleep(interval)
+
+
+async def saved_state(entries: int) -> str:
+    """DATA_DIR whose state holds an address cache snapshot of `entries` wallets"""
+    data_dir = tempfile.mkdtemp(prefix='btcbot-cold-')
+    backend = SQLiteBackend(os.path.join(data_dir, 'bot_state.sqlite3'))
+    await backend.open()
+    wallet = {
+        'address_data': {'chain_stats': {'tx_count': 25, 'funded_txo_sum': 10 ** 8, 'spent_txo_sum': 0}},
+        'transactions': [
+            {'txid': f"{i:064x}", 'status': {'confirmed': True, 'block_time': 1700000000 + i},
+             'vin': [], 'vout': [{'scriptpubkey_address': 'x', 'value': 1000 + i}]}
+            for i in range(25)
+        ],
+        'utxos': {'count': 0, 'unconfirmed_count': 0, 'total_value': 0, 'values': [], 'block_times': [],
+                  'truncated': False},
+        'history': None,
+        'partial': []
+    }
+    backend.save_value('address_cache', {
+        'saved_at': time.time(),
+        'entries': [[f"mainnet:addr{i}", 3600, wallet] for i in range(entries)]
+    })
+    await backend.close()
+    return data_dir
+
+
+async def one_run(args, run: int) -> dict:
+    # A fresh stub per run: a long poll left over from the previous bot would take the update
+    stub = TelegramStub()
+    stub_app = stub.app()
+
+    @web.middleware
+    async def telegram_delay(request, handler):
+        if not request.path.startswith('/stub/'):
+            await asyncio.sleep(args.telegram_latency_ms / 1000)
+        return await handler(request)
+    stub_app.middlewares.append(telegram_delay)
+    stub_runner = web.AppRunner(stub_app, access_log=None)
+    await stub_runner.setup()
+    await web.TCPSite(stub_runner, '127.0.0.1', args.port).start()
+    bot_port = args.port + 1
+    env = dict(
+        os.environ,
+        BOT_TOKEN='123456:COLDSTART',
+        BOT_MODE=args.mode,
+        WEBHOOK_URL=f"http://127.0.0.1:{bot_port}" if args.mode == 'webhook' else '',
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{args.port}",
+        BLOCKSTREAM_API='http://127.0.0.1:9',
+        ESPLORA_FALLBACK_APIS='',
+        COINGECKO_API='http://127.0.0.1:9',
+        PORT=str(bot_port),
+        STATE_BACKEND='sqlite',
+        DATA_DIR=await saved_state(args.cached_addresses),
+    )
+
+    started = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, BOT_PATH, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        ready_call = 'setWebhook' if args.mode == 'webhook' else 'getUpdates'
+        await wait_for(lambda: stub.calls[ready_call])
+        asked = time.monotonic() - started
+        await stub.deliver(message_update(run + 1, 4242, '/start'))
+        await wait_for(lambda: stub.calls['sendMessage'])
+        answered = time.monotonic() - started
+
+        # Let the warm-up finish so every phase is in the report
+        async with aiohttp.ClientSession() as session:
+            phases = {}
+            deadline = time.monotonic() + 10
+            while 'warm' not in phases and time.monotonic() < deadline:
+                async with session.get(f"http://127.0.0.1:{bot_port}/stats") as response:
+                    phases = (await response.json())['liveness'].get('startup')
+                if phases is None:  # a bot without startup tracking
+                    phases = {}
+                    break
+                await asyncio.sleep(0.05)
+    finally:
+        process.terminate()
+        await process.wait()
+        await stub_runner.cleanup()
+    return {'run': run + 1, 'update_requested_s': round(asked, 3), 'answered_s': round(answered, 3), 'phases': phases}
+
+
+async def main():
+    args = parse_args()
+    results = [await one_run(args, run) for run in range(args.runs)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        phases = ', '.join(f"{phase} {seconds:.2f}s" for phase, seconds in result['phases'].items())
+        print(f"run {result['run']}: first reply {result['answered_s']:.2f}s after spawn ({phases})")
+    answered = sorted(result['answered_s'] for result in results)
+    print(f"median first reply: {answered[len(answered) // 2]:.2f}s")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
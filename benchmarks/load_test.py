@@ -0,0 +1,307 @@
+"""Offline load test: drive the bot's handlers against local upstream stubs
+
+    python benchmarks/load_test.py --requests 2000 --concurrency 100
+    python benchmarks/load_test.py --latency-ms 200 --error-rate 0.05 --json
+    python benchmarks/load_test.py --max-p95-ms 800   # exit 1 if slower
+
+A child process serves three aiohttp stubs: Esplora, CoinGecko and the
+Telegram Bot API (benchmarks/telegram_stub.py). Each stub has its own port,
+so the bot's per-host outbound buckets stay separate. Their latency, error
+rate and response sizes are configurable. The bot is imported with its base
+URLs pointed at the stubs and started through its real on_startup hook.
+Synthetic `Update` objects are then fed to `analyze_address` (text
+messages) and `button_handler` (refresh taps) at the requested concurrency.
+
+Reports throughput, p50/p95/p99 handler latency, handler errors, upstream
+calls per request and the bot process's peak RSS (the stubs run
+elsewhere, so they are not counted).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web  # noqa: E402
+
+from address_validator import encode_base58check, encode_segwit  # noqa: E402
+from telegram_stub import TelegramStub, callback_update, message_update  # noqa: E402
+
+BOT_TOKEN = '123456:LOADTEST'
+# Synthetic history ends yesterday, so historical prices are looked up for it
+LAST_BLOCK_TIME = int(time.time()) - 86400
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=1000, help='handler invocations to run')
+    parser.add_argument('--concurrency', type=int, default=50, help='invocations in flight at once')
+    parser.add_argument('--users', type=int, default=0, help='distinct user ids (default: enough to stay under rate limits)')
+    parser.add_argument('--addresses', type=int, default=200, help='distinct addresses; fewer means more cache hits')
+    parser.add_argument('--refresh-ratio', type=float, default=0.2, help='share of refresh button taps')
+    parser.add_argument('--latency-ms', type=float, default=50, help='mean stub latency')
+    parser.add_argument('--jitter-ms', type=float, default=20, help='uniform +/- jitter on stub latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of Esplora answers that are HTTP 500')
+    parser.add_argument('--history-txs', type=int, default=100, help='transactions per address')
+    parser.add_argument('--utxos', type=int, default=50, help='UTXOs per address')
+    parser.add_argument('--telegram-latency-ms', type=float, default=10, help='Telegram stub latency')
+    parser.add_argument('--chain-rate', type=float, default=1000, help='outbound token rate for the Esplora stub')
+    parser.add_argument('--port', type=int, default=18700, help='first of four local ports to use')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--max-p95-ms', type=float, default=None, help='exit 1 if p95 latency exceeds this')
+    return parser.parse_args()
+
+
+def synthetic_addresses(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [
+        encode_segwit('bc', 0, rng.randbytes(20)) if i % 2 else encode_base58check(b'\x00' + rng.randbytes(20))
+        for i in range(count)
+    ]
+
+
+def synthetic_tx(address: str, index: int) -> dict:
+    incoming = index % 3 != 0
+    counterparty = {'scriptpubkey_address': f"bc1qcounterparty{index:026d}", 'value': 20000 + index}
+    mine = {'scriptpubkey_address': address, 'value': 10000 + index}
+    return {
+        'txid': hashlib.sha256(f"{address}:{index}".encode()).hexdigest(),
+        'status': {'confirmed': True, 'block_height': 800000 - index, 'block_time': LAST_BLOCK_TIME - index * 3600},
+        'vin': [{'prevout': counterparty if incoming else mine}],
+        'vout': [mine if incoming else counterparty],
+    }
+
+
+def run_stubs(args, ready):
+    """Child process: serve the Esplora, CoinGecko and Telegram stubs until killed"""
+    rng = random.Random(2)
+    page_size = 25
+
+    async def delay(mean_ms: float):
+        await asyncio.sleep(max(mean_ms + rng.uniform(-args.jitter_ms, args.jitter_ms), 0) / 1000)
+
+    def failing() -> bool:
+        return rng.random() < args.error_rate
+
+    def txs(address: str, start: int) -> list:
+        return [synthetic_tx(address, i) for i in range(start, min(start + page_size, args.history_txs))]
+
+    async def address_stats(request):
+        await delay(args.latency_ms)
+        if failing():
+            return web.Response(status=500)
+        funded = sum(10000 + i for i in range(args.history_txs) if i % 3 != 0)
+        spent = sum(10000 + i for i in range(args.history_txs) if i % 3 == 0)
+        return web.json_response({
+            'address': request.match_info['address'],
+            'chain_stats': {'tx_count': args.history_txs, 'funded_txo_sum': funded, 'spent_txo_sum': spent},
+            'mempool_stats': {'tx_count': 0, 'funded_txo_sum': 0, 'spent_txo_sum': 0},
+        })
+
+    async def address_txs(request):
+        await delay(args.latency_ms)
+        if failing():
+            return web.Response(status=500)
+        return web.json_response(txs(request.match_info['address'], 0))
+
+    async def address_txs_chain(request):
+        await delay(args.latency_ms)
+        if failing():
+            return web.Response(status=500)
+        address = request.match_info['address']
+        # Synthetic txids are hashes, so map the cursor txid back to its position
+        known = {synthetic_tx(address, i)['txid']: i for i in range(args.history_txs)}
+        last_txid = request.match_info.get('last_txid')
+        start = known.get(last_txid, args.history_txs - 1) + 1 if last_txid else 0
+        return web.json_response(txs(address, start))
+
+    async def address_utxo(request):
+        await delay(args.latency_ms)
+        if failing():
+            return web.Response(status=500)
+        return web.json_response([
+            {'txid': f"{i:064x}", 'vout': 0, 'value': 1000 + i * 7,
+             'status': {'confirmed': True, 'block_time': LAST_BLOCK_TIME - i * 600}}
+            for i in range(args.utxos)
+        ])
+
+    async def tip_hash(request):
+        return web.Response(text='0' * 64)
+
+    async def fee_estimates(request):
+        await delay(args.latency_ms)
+        return web.json_response({'1': 25.0, '6': 12.5, '144': 3.2, '1008': 1.0})
+
+    async def price(request):
+        await delay(args.latency_ms)
+        return web.json_response({'bitcoin': {'usd': 65000.0}})
+
+    async def price_range(request):
+        await delay(args.latency_ms)
+        start, end = int(request.query['from']), int(request.query['to'])
+        return web.json_response({'prices': [
+            [day * 1000, 20000.0 + (day // 86400) % 1000 * 50] for day in range(start - start % 86400, end, 86400)
+        ]})
+
+    esplora = web.Application()
+    esplora.router.add_get('/address/{address}', address_stats)
+    esplora.router.add_get('/address/{address}/txs', address_txs)
+    esplora.router.add_get('/address/{address}/txs/chain', address_txs_chain)
+    esplora.router.add_get('/address/{address}/txs/chain/{last_txid}', address_txs_chain)
+    esplora.router.add_get('/address/{address}/utxo', address_utxo)
+    esplora.router.add_get('/blocks/tip/hash', tip_hash)
+    esplora.router.add_get('/fee-estimates', fee_estimates)
+
+    coingecko = web.Application()
+    coingecko.router.add_get('/simple/price', price)
+    coingecko.router.add_get('/coins/bitcoin/market_chart/range', price_range)
+
+    telegram = TelegramStub()
+    telegram_app = telegram.app()
+
+    @web.middleware
+    async def telegram_delay(request, handler):
+        await delay(args.telegram_latency_ms)
+        return await handler(request)
+    telegram_app.middlewares.append(telegram_delay)
+
+    async def serve():
+        runners = []
+        for offset, app in enumerate((esplora, coingecko, telegram_app)):
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', args.port + offset).start()
+            runners.append(runner)
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+async def drive(args, addresses: list) -> dict:
+    import bot
+    from telegram import Update
+    from telegram.ext import Application, CallbackContext
+
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{bot.TELEGRAM_API_BASE_URL}/bot")
+        .updater(None)
+        .build()
+    )
+    await application.initialize()
+    await bot.on_startup(application)
+
+    # Unless --users says otherwise, no synthetic user hits the hourly limit or the per-user cap
+    users = args.users or max(args.requests // max(bot.RATE_LIMIT_PER_HOUR - 1, 1) + 1, args.concurrency)
+    rng = random.Random(3)
+    latencies = []
+    errors = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    upstream_before = bot.HttpClient.stats['requests']
+
+    async def one(update_id: int):
+        user_id = 10000 + update_id % users
+        address = rng.choice(addresses)
+        if rng.random() < args.refresh_ratio:
+            update = Update.de_json(callback_update(update_id, user_id, f"refresh_{address}"), application.bot)
+            handler = bot.button_handler
+        else:
+            update = Update.de_json(message_update(update_id, user_id, address), application.bot)
+            handler = bot.analyze_address
+        context = CallbackContext.from_update(update, application)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await handler(update, context)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(1, args.requests + 1)])
+    elapsed = time.perf_counter() - started
+    upstream_calls = bot.HttpClient.stats['requests'] - upstream_before
+
+    analyses = dict(bot.analyses_total.values)
+    await bot.on_shutdown(application)
+    await application.shutdown()
+
+    ordered = sorted(latencies)
+    return {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'users': users,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(args.requests / elapsed, 1),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 1),
+        'max_ms': round(ordered[-1] * 1000, 1) if ordered else 0.0,
+        'handler_errors': errors,
+        'outcomes': {labels[0]: count for labels, count in analyses.items()},
+        'upstream_calls_per_request': round(upstream_calls / args.requests, 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    args = parse_args()
+    ready = multiprocessing.Event()
+    stubs = multiprocessing.Process(target=run_stubs, args=(args, ready), daemon=True)
+    stubs.start()
+    if not ready.wait(timeout=10):
+        sys.exit("stubs did not start")
+
+    os.environ.update({
+        'BOT_TOKEN': BOT_TOKEN,
+        'BLOCKSTREAM_API': f"http://127.0.0.1:{args.port}",
+        'ESPLORA_FALLBACK_APIS': '',
+        'COINGECKO_API': f"http://127.0.0.1:{args.port + 1}",
+        'TELEGRAM_API_BASE_URL': f"http://127.0.0.1:{args.port + 2}",
+        'PORT': str(args.port + 3),
+        'BOT_MODE': 'polling',
+        'STATE_BACKEND': 'memory',
+        'DATA_DIR': tempfile.mkdtemp(prefix='btcbot-load-'),
+        'CHAIN_API_RATE': str(args.chain_rate),
+        'CHAIN_API_BURST': str(args.chain_rate),
+    })
+
+    try:
+        report = asyncio.run(drive(args, synthetic_addresses(args.addresses)))
+    finally:
+        stubs.terminate()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['requests']:,} requests, concurrency {report['concurrency']}, {report['users']} users")
+        print(f"  throughput   {report['throughput_rps']} req/s over {report['elapsed_s']} s")
+        print(f"  latency      p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, "
+              f"p99 {report['p99_ms']} ms, max {report['max_ms']} ms")
+        print(f"  outcomes     {report['outcomes']}")
+        print(f"  errors       {report['handler_errors'] or 'none'}")
+        print(f"  upstream     {report['upstream_calls_per_request']} calls per request")
+        print(f"  peak RSS     {report['peak_rss_mb']} MB")
+
+    if args.max_p95_ms is not None and report['p95_ms'] > args.max_p95_ms:
+        print(f"p95 {report['p95_ms']} ms exceeds the {args.max_p95_ms} ms gate")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
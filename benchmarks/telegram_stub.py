@@ -0,0 +1,167 @@
+"""Local stand-in for the Telegram Bot API, for running the bot without Telegram
+
+    python benchmarks/telegram_stub.py [port]
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 BOT_MODE=webhook \\
+        WEBHOOK_URL=http://127.0.0.1:10000 python bot.py
+
+Answers the Bot API methods the bot uses with canned results. Updates
+posted to /stub/updates (a JSON object, or a list of them) are delivered
+the way the bot asked for them: pushed to the webhook registered with
+setWebhook, or handed out by getUpdates when polling. GET /stub/calls
+shows the calls per method and the last messages the bot sent.
+"""
+import asyncio
+import itertools
+import json
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Stub Bot', 'username': 'stub_bot'}
+
+
+def message_update(update_id: int, user_id: int, text: str, message_id: int = None) -> dict:
+    """Update dict for a private text message from `user_id`"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+    message = {
+        'message_id': message_id or update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': user,
+        'text': text
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id: int, user_id: int, data: str, message_id: int = 1) -> dict:
+    """Update dict for an inline button tap by `user_id`"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': '…'
+            }
+        }
+    }
+
+
+class TelegramStub:
+    def __init__(self):
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.pending = asyncio.Queue()
+        self.message_ids = itertools.count(1000)
+        self.messages = []
+        self.calls = Counter()
+        self.session = None
+
+    async def _params(self, request) -> dict:
+        if request.content_type == 'application/json':
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    def _message(self, params: dict) -> dict:
+        message = {
+            'message_id': params.get('message_id') or next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': params.get('chat_id'), 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', '')
+        }
+        self.messages.append(message)
+        return message
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await self._params(request)
+        self.calls[method] += 1
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method == 'setWebhook':
+            self.webhook_url = params.get('url')
+            self.webhook_secret = params.get('secret_token')
+            result = True
+        elif method == 'deleteWebhook':
+            self.webhook_url = None
+            result = True
+        elif method == 'getUpdates':
+            result = await self._poll(float(params.get('timeout') or 0))
+        elif method in ('sendMessage', 'editMessageText'):
+            result = self._message(params)
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _poll(self, timeout: float) -> list:
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.pending.get(), timeout=max(timeout, 0.01)))
+        except asyncio.TimeoutError:
+            return updates
+        while not self.pending.empty():
+            updates.append(self.pending.get_nowait())
+        return updates
+
+    async def deliver(self, update: dict):
+        """Push one update to the registered webhook, or queue it for getUpdates"""
+        if self.webhook_url is None:
+            await self.pending.put(update)
+            return
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret or ''}
+        async with self.session.post(self.webhook_url, json=update, headers=headers) as response:
+            if response.status != 200:
+                print(f"webhook answered {response.status}")
+
+    async def inject(self, request):
+        payload = await request.json()
+        for update in payload if isinstance(payload, list) else [payload]:
+            await self.deliver(update)
+        return web.json_response({'ok': True})
+
+    async def report(self, request):
+        return web.json_response({'calls': self.calls, 'messages': self.messages[-20:]})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        app.router.add_post('/stub/updates', self.inject)
+        app.router.add_get('/stub/calls', self.report)
+        app.on_cleanup.append(self._close)
+        return app
+
+    async def _close(self, app):
+        if self.session is not None:
+            await self.session.close()
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    web.run_app(TelegramStub().app(), host='127.0.0.1', port=port)
+
+
+if __name__ == '__main__':
+    main()
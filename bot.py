@@ -1,13 +1,40 @@
 import asyncio
 import aiohttp
+import hashlib
 import json
+import math
 import os
-import threading
-from datetime import datetime, timedelta
-from collections import defaultdict
+import re
+import signal
+import sys
+import time
+from array import array
+from datetime import datetime
+from collections import OrderedDict, deque
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from flask import Flask
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters, ContextTypes
+from aiohttp import web
+from http_client import HttpClient
+from price_cache import PriceCache
+from price_history import PriceHistory
+from address_cache import AddressCache
+from state_store import MemoryBackend, create_backend
+from tx_history import TxHistoryFetcher
+from json_stream import iter_json_array
+from tx_analysis import load_numpy, net_flows
+from utxo_analysis import FeeEstimateCache, summarize_utxos
+from batch_scheduler import BoundedScheduler
+from address_validator import InvalidAddressError, is_valid_address, validate_address
+from chain_providers import ProviderPool, UpstreamUnavailable
+from outbound_scheduler import SchedulerBusy, background_lane, outbound
+from wallet_watcher import WalletWatcher
+from liveness import LivenessMonitor
+from metrics import registry
+from inflight import CLAIMED, DUPLICATE, InFlightTracker
+from sharding import ShardRouter, WorkerSupervisor, shard_for
+from urllib.parse import urlparse
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
 
 # Bot Token - Environment variable'dan al
 BOT_TOKEN = os.getenv("BOT_TOKEN", "7715414446:AAGDvt3TiyjZxWAr6NzY8CN5qQf0_fy4PWw")
@@ -19,146 +46,576 @@ DEVELOPER_BTC_ADDRESS = "bc1qzv7v3kengms6zguh7445xxy77dsrwjqxxrcxrt"
 BOT_X_ACCOUNT = "https://x.com/BTCAnalyzerBot?t=q0r56PngC-wbjOERZrg9iw&s=09"
 
 # API Base URLs
-BLOCKSTREAM_API = "https://blockstream.info/api"
-COINGECKO_API = "https://api.coingecko.com/api/v3"
+BLOCKSTREAM_API = os.getenv('BLOCKSTREAM_API', "https://blockstream.info/api")
+# Esplora-compatible fallbacks used when Blockstream fails or is slow (comma separated)
+ESPLORA_FALLBACK_APIS = [
+    url.strip() for url in os.getenv('ESPLORA_FALLBACK_APIS', "https://mempool.space/api").split(',')
+    if url.strip()
+]
+COINGECKO_API = os.getenv('COINGECKO_API', "https://api.coingecko.com/api/v3")
+
+# Overall deadline for the parallel Blockstream calls of one analysis (seconds)
+ADDRESS_INFO_DEADLINE = 15
+
+# BTC price cache: fresh for PRICE_CACHE_TTL seconds, served stale (while
+# revalidating) up to PRICE_STALE_TTL, refreshed in the background every
+# PRICE_REFRESH_INTERVAL seconds
+PRICE_CACHE_TTL = int(os.getenv('PRICE_CACHE_TTL', 30))
+PRICE_STALE_TTL = int(os.getenv('PRICE_STALE_TTL', 900))
+PRICE_REFRESH_INTERVAL = int(os.getenv('PRICE_REFRESH_INTERVAL', 20))
+
+# Historical BTC/USD: daily prices stored under DATA_DIR, fetched at most
+# PRICE_HISTORY_MAX_DAYS back (CoinGecko's public API limit) and pre-fetched
+# for the last PRICE_HISTORY_WARM_DAYS days at startup
+PRICE_HISTORY_MAX_DAYS = int(os.getenv('PRICE_HISTORY_MAX_DAYS', 365))
+PRICE_HISTORY_WARM_DAYS = int(os.getenv('PRICE_HISTORY_WARM_DAYS', 365))
+
+# Address result cache: bounded by entry count and approximate size, with a
+# shorter TTL while an address has unconfirmed (mempool) activity
+ADDRESS_CACHE_MAX_ENTRIES = int(os.getenv('ADDRESS_CACHE_MAX_ENTRIES', 1000))
+ADDRESS_CACHE_MAX_BYTES = int(os.getenv('ADDRESS_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+ADDRESS_CACHE_CONFIRMED_TTL = int(os.getenv('ADDRESS_CACHE_CONFIRMED_TTL', 120))
+ADDRESS_CACHE_MEMPOOL_TTL = int(os.getenv('ADDRESS_CACHE_MEMPOOL_TTL', 15))
+
+# Parse /txs and /utxo incrementally instead of loading whole bodies, and stop
+# collecting UTXOs after UTXO_STREAM_MAX_ITEMS entries
+STREAM_PARSE = os.getenv('STREAM_PARSE', '1') == '1'
+UTXO_STREAM_MAX_ITEMS = int(os.getenv('UTXO_STREAM_MAX_ITEMS', 200000))
+
+# UTXO breakdown: fee estimates are cached for FEE_ESTIMATE_TTL seconds and the
+# consolidation estimate uses the rate for confirmation within CONSOLIDATION_TARGET_BLOCKS
+FEE_ESTIMATE_TTL = int(os.getenv('FEE_ESTIMATE_TTL', 300))
+CONSOLIDATION_TARGET_BLOCKS = int(os.getenv('CONSOLIDATION_TARGET_BLOCKS', 144))
+
+# Transaction history walk: budget per refresh (25 txs per page) and the
+# number of history pages fetched concurrently across all addresses. An
+# analysis walks at most HISTORY_INTERACTIVE_PAGES pages past the first one
+# before replying; the rest of the budget is walked in the background.
+HISTORY_MAX_PAGES = int(os.getenv('HISTORY_MAX_PAGES', 40))
+HISTORY_INTERACTIVE_PAGES = int(os.getenv('HISTORY_INTERACTIVE_PAGES', 1))
+HISTORY_MAX_BYTES = int(os.getenv('HISTORY_MAX_BYTES', 4 * 1024 * 1024))
+HISTORY_CONCURRENCY = int(os.getenv('HISTORY_CONCURRENCY', 4))
+
+# Batch analysis: addresses per message, addresses covered by one rate-limit
+# slot, scheduler limits and how often the progress message is edited
+BATCH_MAX_ADDRESSES = 100
+BATCH_ADDRESSES_PER_REQUEST = 10
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 16))
+BATCH_PER_HOST_CONCURRENCY = int(os.getenv('BATCH_PER_HOST_CONCURRENCY', 8))
+BATCH_EDIT_INTERVAL = 1.5
+
+# Outbound request budget per upstream host (requests per second, burst size)
+CHAIN_API_RATE = float(os.getenv('CHAIN_API_RATE', 10))
+CHAIN_API_BURST = float(os.getenv('CHAIN_API_BURST', 20))
+PRICE_API_RATE = float(os.getenv('PRICE_API_RATE', 0.5))
+PRICE_API_BURST = float(os.getenv('PRICE_API_BURST', 5))
+
+# Watch mode: poll interval, sweep slice per poll and per-chat subscription cap
+WATCH_POLL_INTERVAL = int(os.getenv('WATCH_POLL_INTERVAL', 30))
+WATCH_SWEEP_BATCH = int(os.getenv('WATCH_SWEEP_BATCH', 25))
+WATCH_CONCURRENCY = int(os.getenv('WATCH_CONCURRENCY', 4))
+WATCH_MAX_PER_CHAT = int(os.getenv('WATCH_MAX_PER_CHAT', 20))
+
+# Health/metrics web server; /health fails once the event loop lags this much (seconds)
+PORT = int(os.getenv('PORT', 10000))
+HEALTH_MAX_LOOP_LAG = float(os.getenv('HEALTH_MAX_LOOP_LAG', 2.0))
+
+# Update ingestion: 'webhook' receives updates on the health server port, 'polling' is for local development,
+# 'sharded' receives them and forwards each to one of SHARD_WORKERS 'worker' processes chosen by user id
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', os.getenv('RENDER_EXTERNAL_URL', ''))
+BOT_MODE = os.getenv('BOT_MODE', 'webhook' if WEBHOOK_URL else 'polling')
+WEBHOOK_PATH = '/telegram'
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32])
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 32))
+# Point at a local stand-in (see benchmarks/telegram_stub.py) to run without Telegram
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')
+# Only the update types that have handlers
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Sharded mode: worker count, the first worker port (workers listen on 127.0.0.1) and the
+# shutdown drain budget. SHARD_INDEX/SHARD_COUNT are set for each worker by the receiver.
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', os.cpu_count() or 2))
+WORKER_BASE_PORT = int(os.getenv('WORKER_BASE_PORT', PORT + 1))
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', 0))
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 1))
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', 25))
+
+# Simultaneous analyses per user (a batch counts as one)
+MAX_ANALYSES_PER_USER = int(os.getenv('MAX_ANALYSES_PER_USER', 2))
 
 # Rate limiting settings
 RATE_LIMIT_PER_HOUR = 10
 RATE_LIMIT_PER_DAY = 50
 
-# In-memory storage for rate limiting
-user_requests = defaultdict(list)
+# Persistence backend for rate limits and caches ('memory' or 'sqlite' under DATA_DIR)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+DATA_DIR = os.getenv('DATA_DIR', '/data')
+
+# Cache snapshot entries restored per event-loop turn during the startup warm-up
+CACHE_RESTORE_SLICE = 100
+
+# How often idle users are evicted from the rate limiter (seconds)
+RATE_LIMIT_EVICT_INTERVAL = 60
+
+# In-memory storage for rate limiting: user_id -> UserWindow, ordered by last request
+user_requests = OrderedDict()
+
+# Replaced in on_startup by the backend selected with STATE_BACKEND
+state_backend = MemoryBackend()
 
-# Flask app for health check
-app = Flask(__name__)
+# Set in on_startup; the watcher pushes notifications through its bot
+telegram_app = None
 
-@app.route('/health')
-def health_check():
-    return {'status': 'ok', 'timestamp': datetime.now().isoformat()}, 200
+liveness = LivenessMonitor(max_lag=HEALTH_MAX_LOOP_LAG)
 
-@app.route('/')
-def home():
-    return {'message': 'Bitcoin Analyzer Bot is running', 'status': 'active'}, 200
+# Health/metrics routes, served by an aiohttp server on the bot's own event loop
+routes = web.RouteTableDef()
+web_runner = None
+
+@routes.get('/health')
+async def health_check(request):
+    """Liveness of the bot loop plus upstream state"""
+    breakers = {provider.host: provider.breaker.state for provider in chain_pool.providers}
+    alive = liveness.is_healthy() and telegram_app is not None and telegram_app.running
+    # Open breakers only mean 'degraded': restarting the bot would not fix the providers
+    upstream_ok = any(state != 'open' for state in breakers.values())
+    if not alive:
+        status = 'unhealthy'
+    elif not upstream_ok:
+        status = 'degraded'
+    else:
+        status = 'ok'
+    return web.json_response({
+        'status': status,
+        'timestamp': datetime.now().isoformat(),
+        'liveness': liveness.summary(),
+        'breakers': breakers
+    }, status=200 if alive else 503)
+
+@routes.get('/metrics')
+async def metrics(request):
+    """Prometheus text export of the metrics registry"""
+    return web.Response(
+        text=registry.render(),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    )
+
+@routes.get('/stats')
+async def stats(request):
+    """Internal counters of every cache, pool and scheduler"""
+    return web.json_response({
+        'liveness': liveness.summary(),
+        'http_pool': dict(HttpClient.stats, reuse_ratio=round(HttpClient.reuse_ratio(), 3)),
+        'upstream_latency': HttpClient.timing_summary(),
+        'price_cache': price_cache.stats,
+        'fee_estimates': fee_estimates.stats,
+        'price_history': price_history.summary(),
+        'address_cache': address_cache.summary(),
+        'tx_history': dict(tx_history.stats, cursors=len(tx_history.cursors)),
+        'chain_providers': dict(chain_pool.stats, providers=chain_pool.summary()),
+        'outbound': outbound.summary(),
+        'watcher': wallet_watcher.summary(),
+        'inflight': inflight.summary(),
+        'shard': {'index': SHARD_INDEX, 'count': SHARD_COUNT}
+    })
+
+@routes.get('/')
+async def home(request):
+    return web.json_response({'message': 'Bitcoin Analyzer Bot is running', 'status': 'active'})
+
+async def telegram_webhook(request):
+    """Hand an update pushed by Telegram to the application's update queue"""
+    if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+        return web.Response(status=403)
+    if telegram_app is None:
+        return web.Response(status=503)
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+    await telegram_app.update_queue.put(Update.de_json(data, telegram_app.bot))
+    return web.Response()
+
+async def start_web_server():
+    global web_runner
+    if web_runner is not None:
+        return
+    web_app = web.Application()
+    web_app.add_routes(routes)
+    if BOT_MODE in ('webhook', 'worker'):
+        web_app.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    web_runner = web.AppRunner(web_app, access_log=None)
+    await web_runner.setup()
+    # Workers are only reached through the sharded receiver
+    host = '127.0.0.1' if BOT_MODE == 'worker' else '0.0.0.0'
+    await web.TCPSite(web_runner, host, PORT).start()
+    liveness.mark_startup('listening')
+
+async def stop_web_server():
+    global web_runner
+    if web_runner is not None:
+        await web_runner.cleanup()
+        web_runner = None
+
+def owns_user(user_id: int) -> bool:
+    """Whether this process handles `user_id` (always true outside sharded mode)"""
+    return shard_for(user_id, SHARD_COUNT) == SHARD_INDEX
+
+def polls_watches() -> bool:
+    """Whether this process polls the chain for watched addresses; one worker does it for every shard"""
+    return SHARD_INDEX == 0
+
+def state_key(name: str) -> str:
+    """Backend key for per-process state, so workers sharing a database keep theirs apart"""
+    return name if SHARD_COUNT == 1 else f"{name}:{SHARD_INDEX}"
+
+class UserWindow:
+    """Request timestamps of one user inside the hourly and daily windows"""
+    __slots__ = ('hour', 'day')
+
+    def __init__(self):
+        self.hour = deque()
+        self.day = deque()
+
+    def expire(self, now: float):
+        """Drop timestamps that fell out of their window (amortized O(1))"""
+        hour_ago = now - 3600
+        day_ago = now - 86400
+        while self.hour and self.hour[0] <= hour_ago:
+            self.hour.popleft()
+        while self.day and self.day[0] <= day_ago:
+            self.day.popleft()
 
 class RateLimiter:
     @staticmethod
-    def clean_old_requests():
-        """Remove requests older than 24 hours"""
-        current_time = datetime.now()
-        cutoff_time = current_time - timedelta(hours=24)
-        
-        for user_id in list(user_requests.keys()):
-            user_requests[user_id] = [
-                req_time for req_time in user_requests[user_id] 
-                if req_time > cutoff_time
-            ]
-            if not user_requests[user_id]:
-                del user_requests[user_id]
+    def clean_old_requests(max_users: int = None):
+        """Evict users with no requests in the last 24 hours, at most `max_users` per call"""
+        day_ago = time.time() - 86400
+        evicted = 0
+        # Users are kept in last-request order, so only the idle prefix is visited
+        while user_requests and (max_users is None or evicted < max_users):
+            user_id, window = next(iter(user_requests.items()))
+            if window.day and window.day[-1] > day_ago:
+                break
+            del user_requests[user_id]
+            evicted += 1
+        return evicted
     
     @staticmethod
     def check_user_limit(user_id: int) -> dict:
         """Check if user has exceeded rate limits"""
-        RateLimiter.clean_old_requests()
-        
-        current_time = datetime.now()
-        user_reqs = user_requests.get(user_id, [])
+        RateLimiter.clean_old_requests(max_users=8)
         
-        hour_ago = current_time - timedelta(hours=1)
-        hourly_requests = [req for req in user_reqs if req > hour_ago]
-        
-        day_ago = current_time - timedelta(days=1)
-        daily_requests = [req for req in user_reqs if req > day_ago]
+        window = user_requests.get(user_id)
+        if window is not None:
+            window.expire(time.time())
+            hourly_used = len(window.hour)
+            daily_used = len(window.day)
+        else:
+            hourly_used = daily_used = 0
         
         return {
             'can_proceed': (
-                len(hourly_requests) < RATE_LIMIT_PER_HOUR and 
-                len(daily_requests) < RATE_LIMIT_PER_DAY
+                hourly_used < RATE_LIMIT_PER_HOUR and 
+                daily_used < RATE_LIMIT_PER_DAY
             ),
-            'hourly_used': len(hourly_requests),
-            'daily_used': len(daily_requests),
-            'hourly_remaining': RATE_LIMIT_PER_HOUR - len(hourly_requests),
-            'daily_remaining': RATE_LIMIT_PER_DAY - len(daily_requests)
+            'hourly_used': hourly_used,
+            'daily_used': daily_used,
+            'hourly_remaining': RATE_LIMIT_PER_HOUR - hourly_used,
+            'daily_remaining': RATE_LIMIT_PER_DAY - daily_used
         }
     
     @staticmethod
     def record_request(user_id: int):
         """Record a new request"""
-        current_time = datetime.now()
-        user_requests[user_id].append(current_time)
+        current_time = time.time()
+        RateLimiter._append(user_id, current_time)
+        state_backend.record_rate_event(user_id, current_time)
+    
+    @staticmethod
+    def _append(user_id: int, timestamp: float):
+        window = user_requests.get(user_id)
+        if window is None:
+            window = user_requests[user_id] = UserWindow()
+        else:
+            user_requests.move_to_end(user_id)
+        window.expire(timestamp)
+        window.hour.append(timestamp)
+        window.day.append(timestamp)
+    
+    @staticmethod
+    async def restore(backend):
+        """Rebuild the last 24 hours of requests from the persistence backend"""
+        events = await backend.load_rate_events(time.time() - 86400)
+        restored = 0
+        for user_id, timestamp in events:
+            if owns_user(user_id):
+                RateLimiter._append(user_id, timestamp)
+                restored += 1
+        return restored
+    
+    @staticmethod
+    async def run_evictor():
+        """Background task that evicts idle users between checks"""
+        while True:
+            await asyncio.sleep(RATE_LIMIT_EVICT_INTERVAL)
+            RateLimiter.clean_old_requests()
+
+class UtxoCollector:
+    """Reduces a UTXO list to counts and compact value/time columns"""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self.values = array('q')
+        self.block_times = array('q')  # 0 while unconfirmed
+        self.truncated = False
+
+    def add(self, utxo: dict) -> bool:
+        """Take one UTXO; returns False once enough have been collected"""
+        if len(self.values) >= self.max_items:
+            self.truncated = True
+            return False
+        status = utxo.get('status', {})
+        self.values.append(utxo.get('value', 0))
+        self.block_times.append((status.get('block_time') or 0) if status.get('confirmed') else 0)
+        return True
+
+    def result(self) -> dict:
+        return {
+            'count': len(self.values),
+            'unconfirmed_count': self.block_times.count(0),
+            'total_value': sum(self.values),
+            'values': self.values,
+            'block_times': self.block_times,
+            'truncated': self.truncated
+        }
 
 class BitcoinAnalyzer:
+    @staticmethod
+    def slim_transaction(tx: dict, address: str) -> dict:
+        """Keep only the fields of a transaction that the analysis reads"""
+        def matches(addr) -> bool:
+            return addr == address or (isinstance(addr, list) and address in addr)
+        
+        status = tx.get('status', {})
+        return {
+            'txid': tx['txid'],
+            'status': {
+                'confirmed': status.get('confirmed', False),
+                'block_time': status.get('block_time')
+            },
+            'vin': [
+                {'prevout': {'scriptpubkey_address': address, 'value': vin['prevout'].get('value', 0)}}
+                for vin in tx.get('vin', [])
+                if vin.get('prevout') and matches(vin['prevout'].get('scriptpubkey_address'))
+            ],
+            'vout': [
+                {'scriptpubkey_address': address, 'value': vout.get('value', 0)}
+                for vout in tx.get('vout', [])
+                if matches(vout.get('scriptpubkey_address'))
+            ]
+        }
+
+    @staticmethod
+    async def fetch_btc_price():
+        """Fetch the current Bitcoin price from CoinGecko (None on failure)"""
+        data = await asyncio.wait_for(
+            BitcoinAnalyzer.fetch_json('price', f"{COINGECKO_API}/simple/price?ids=bitcoin&vs_currencies=usd"),
+            timeout=10
+        )
+        if not data:
+            return None
+        return data.get('bitcoin', {}).get('usd')
+
+    @staticmethod
+    async def fetch_price_range(start: int, end: int):
+        """Fetch [ms, price] BTC/USD points between two unix times from CoinGecko (None on failure)"""
+        data = await asyncio.wait_for(
+            BitcoinAnalyzer.fetch_json(
+                'price_history',
+                f"{COINGECKO_API}/coins/bitcoin/market_chart/range?vs_currency=usd&from={start}&to={end}"
+            ),
+            timeout=15
+        )
+        if not data:
+            return None
+        return data.get('prices')
+
     @staticmethod
     async def get_btc_price():
-        """Get current Bitcoin price"""
-        async with aiohttp.ClientSession() as session:
-            try:
-                headers = {
-                    'User-Agent': 'Bitcoin-Analyzer-Bot/1.0',
-                    'Accept': 'application/json'
-                }
-                
-                async with session.get(
-                    f"{COINGECKO_API}/simple/price?ids=bitcoin&vs_currencies=usd",
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status != 200:
-                        print(f"Price API error: {response.status}")
-                        return 65000
-                    data = await response.json()
-                    return data.get('bitcoin', {}).get('usd', 65000)
-            except Exception as e:
-                print(f"Error fetching BTC price: {e}")
-                return 65000
+        """Get the current Bitcoin price as a PriceQuote (None if never fetched)"""
+        return await price_cache.get()
+
+    @staticmethod
+    async def fetch_fee_estimates():
+        """Fetch the fee rate (sat/vB) per confirmation target from the chain providers"""
+        return await BitcoinAnalyzer.fetch_chain_json('fee_estimates', '/fee-estimates')
+
+    @staticmethod
+    async def fetch_json(endpoint: str, url: str):
+        """GET a JSON document, recording the call's latency under `endpoint`"""
+        host = urlparse(url).netloc
+        await outbound.acquire(host)
+        session = await HttpClient.get_session()
+        started = time.perf_counter()
+        try:
+            async with session.get(url) as response:
+                HttpClient.record_status(host, response.status)
+                if response.status != 200:
+                    print(f"{endpoint} API error: {response.status}")
+                    return None
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            HttpClient.record_status(host, 'error')
+            raise
+        finally:
+            HttpClient.record_timing(endpoint, time.perf_counter() - started)
+
+    @staticmethod
+    async def fetch_chain_json(endpoint: str, path: str):
+        """GET a JSON document from the chain data providers (None unless 200)"""
+        return await chain_pool.request(endpoint, path, lambda response: response.json())
+
+    @staticmethod
+    async def fetch_raw(endpoint: str, path: str):
+        """GET a chain data path and return the raw body (None unless 200)"""
+        return await chain_pool.request(endpoint, path, lambda response: response.read())
+
+    @staticmethod
+    async def fetch_stream(endpoint: str, path: str, consume):
+        """GET a chain data JSON array and hand its elements to `consume` as they arrive"""
+        # consume may stop early (the rest is never downloaded) and runs once per hedged attempt,
+        # so it must not share state between calls
+        return await chain_pool.request(
+            endpoint, path, lambda response: consume(iter_json_array(response.content))
+        )
+
+    @staticmethod
+    async def fetch_transactions(address: str):
+        """First page of an address's transactions, slimmed to what the analysis needs"""
+        path = f"/address/{address}/txs"
+        if not STREAM_PARSE:
+            transactions = await BitcoinAnalyzer.fetch_chain_json('txs', path)
+            if transactions is None:
+                return None
+            return [BitcoinAnalyzer.slim_transaction(tx, address) for tx in transactions]
+        
+        async def consume(items):
+            return [BitcoinAnalyzer.slim_transaction(tx, address) async for tx in items]
+        return await BitcoinAnalyzer.fetch_stream('txs', path, consume)
+
+    @staticmethod
+    async def fetch_utxos(address: str):
+        """UTXO counts and value columns of an address"""
+        path = f"/address/{address}/utxo"
+        if not STREAM_PARSE:
+            utxos = await BitcoinAnalyzer.fetch_chain_json('utxo', path)
+            if utxos is None:
+                return None
+            collector = UtxoCollector(UTXO_STREAM_MAX_ITEMS)
+            for utxo in utxos:
+                if not collector.add(utxo):
+                    break
+            return collector.result()
+        
+        async def consume(items):
+            collector = UtxoCollector(UTXO_STREAM_MAX_ITEMS)
+            async for utxo in items:
+                if not collector.add(utxo):
+                    break
+            return collector.result()
+        return await BitcoinAnalyzer.fetch_stream('utxo', path, consume)
 
     @staticmethod
-    async def get_address_info(address: str):
+    async def get_address_info(address: str, bypass_cache: bool = False, cache_key: str = None,
+                               walk_history: bool = True):
+        """Get address information, served from the address cache when possible"""
+        return await address_cache.get_or_fetch(
+            cache_key or address,
+            lambda: BitcoinAnalyzer.fetch_address_info(address, walk_history),
+            bypass=bypass_cache
+        )
+
+    @staticmethod
+    async def fetch_address_info(address: str, walk_history: bool = True):
         """Get detailed information about a Bitcoin address"""
-        async with aiohttp.ClientSession() as session:
+        fee_rate_task = asyncio.create_task(fee_estimates.rate_for(CONSOLIDATION_TARGET_BLOCKS))
+        tasks = {
+            'address': asyncio.create_task(BitcoinAnalyzer.fetch_chain_json('address', f"/address/{address}")),
+            'txs': asyncio.create_task(BitcoinAnalyzer.fetch_transactions(address)),
+            'utxo': asyncio.create_task(BitcoinAnalyzer.fetch_utxos(address)),
+        }
+        
+        deadline = time.monotonic() + ADDRESS_INFO_DEADLINE
+        
+        # Without /address there is nothing to show, so stop waiting as soon as it fails
+        await asyncio.wait([tasks['address']], timeout=ADDRESS_INFO_DEADLINE)
+        address_task = tasks['address']
+        address_ok = (
+            address_task.done() and address_task.exception() is None
+            and address_task.result() is not None
+        )
+        if address_ok:
+            await asyncio.wait(
+                [tasks['txs'], tasks['utxo']],
+                timeout=max(deadline - time.monotonic(), 0)
+            )
+        
+        # A failed or late /txs or /utxo only degrades the result: empty, and listed under 'partial'
+        results = {}
+        for name, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                if address_ok or name == 'address':
+                    print(f"Error fetching {name}: deadline of {ADDRESS_INFO_DEADLINE}s exceeded")
+                results[name] = None
+            elif task.exception() is not None:
+                print(f"Error fetching {name}: {task.exception()}")
+                results[name] = None
+            else:
+                results[name] = task.result()
+        
+        if results['address'] is None:
+            fee_rate_task.cancel()
+            if address_task.done() and isinstance(address_task.exception(), UpstreamUnavailable):
+                raise address_task.exception()
+            return None
+        
+        history = None
+        if results['txs'] is not None and walk_history:
+            # A short walk within the deadline; run_analysis continues it in the background
+            cursor = await tx_history.refresh(
+                address, first_page=results['txs'], deadline=deadline, max_pages=HISTORY_INTERACTIVE_PAGES
+            )
+            history = cursor.summary()
+        elif results['txs'] is not None:
+            # Batches skip the walk and use whatever cursor is already known
+            cursor = tx_history.get_cursor(address)
+            history = cursor.summary() if cursor is not None else None
+        
+        # Computed once per fetch, so cached answers do not pay for it again
+        utxo_summary = None
+        if results['utxo'] is not None:
+            # Fee estimates are cached, so this rarely waits; without them there is no consolidation estimate
             try:
-                headers = {
-                    'User-Agent': 'Bitcoin-Analyzer-Bot/1.0',
-                    'Accept': 'application/json'
-                }
-                
-                async with session.get(
-                    f"{BLOCKSTREAM_API}/address/{address}",
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status != 200:
-                        print(f"Address API error: {response.status}")
-                        return None
-                    address_data = await response.json()
-                
-                async with session.get(
-                    f"{BLOCKSTREAM_API}/address/{address}/txs",
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status != 200:
-                        transactions = []
-                    else:
-                        transactions = await response.json()
-                
-                async with session.get(
-                    f"{BLOCKSTREAM_API}/address/{address}/utxo",
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status != 200:
-                        utxos = []
-                    else:
-                        utxos = await response.json()
-                
-                return {
-                    'address_data': address_data,
-                    'transactions': transactions,
-                    'utxos': utxos
-                }
-            except Exception as e:
-                print(f"Error fetching data: {e}")
-                return None
+                fee_rate = await asyncio.wait_for(fee_rate_task, timeout=max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                fee_rate = None
+            utxo_summary = summarize_utxos(
+                results['utxo']['values'], results['utxo']['block_times'], validate_address(address).type, fee_rate
+            )
+        else:
+            fee_rate_task.cancel()
+        
+        return {
+            'address_data': results['address'],
+            'transactions': results['txs'] if results['txs'] is not None else [],
+            'utxos': results['utxo'] if results['utxo'] is not None else UtxoCollector(0).result(),
+            'utxo_summary': utxo_summary,
+            'history': history,
+            'partial': [name for name in ('txs', 'utxo') if results[name] is None]
+        }
 
     @staticmethod
     def format_btc(satoshis: int) -> str:
@@ -169,10 +626,177 @@ class BitcoinAnalyzer:
     @staticmethod
     def format_usd(satoshis: int, btc_price: float) -> str:
         """Convert satoshis to USD using real BTC price"""
+        if btc_price is None:
+            return "$N/A"
         btc = satoshis / 100000000
         usd = btc * btc_price
         return f"${usd:,.2f}"
 
+    @staticmethod
+    def format_utxo_summary(summary: dict, btc_price: float) -> str:
+        """UTXO breakdown lines of the analysis message"""
+        def classes(rows) -> str:
+            return " · ".join(f"{row['label']}: {row['count']:,}" for row in rows if row['count']) or "none"
+        
+        confirmed = summary['confirmed']
+        unconfirmed = summary['unconfirmed']
+        lines = [
+            f"• Confirmed: {BitcoinAnalyzer.format_btc(confirmed['value'])} in {confirmed['count']:,}",
+            f"• Unconfirmed: {BitcoinAnalyzer.format_btc(unconfirmed['value'])} in {unconfirmed['count']:,}",
+            f"• Sizes (BTC): {classes(summary['size_classes'])}",
+            f"• Ages: {classes(summary['ages'])}"
+        ]
+        consolidation = summary['consolidation']
+        if consolidation and summary['count'] > 1:
+            lines.append(
+                f"• Consolidation: ~{consolidation['vbytes']:,} vB, "
+                f"{BitcoinAnalyzer.format_btc(consolidation['fee'])} "
+                f"({BitcoinAnalyzer.format_usd(consolidation['fee'], btc_price)}) at {consolidation['fee_rate']:.1f} sat/vB"
+            )
+            if consolidation['uneconomical']:
+                lines.append(f"• {consolidation['uneconomical']:,} UTXOs cost more to spend than they hold")
+        return "\n".join(lines)
+
+    @staticmethod
+    def format_realized_flows(flows: list, tx_prices: list, btc_price: float) -> str:
+        """USD received and sent, valued at each transaction's own price, against today's value"""
+        priced = [(flow, price) for flow, price in zip(flows, tx_prices) if price is not None]
+        if not priced:
+            return "• Historical prices unavailable"
+        usd_in = sum(received * price for (received, sent, net), price in priced) / 100000000
+        usd_out = sum(sent * price for (received, sent, net), price in priced) / 100000000
+        net_sats = sum(net for (received, sent, net), price in priced)
+        lines = [
+            f"• In: ${usd_in:,.2f} · Out: ${usd_out:,.2f} (last {len(priced)} txs)",
+            f"• Net: ${usd_in - usd_out:,.2f} then, {BitcoinAnalyzer.format_usd(net_sats, btc_price)} at today's price"
+        ]
+        if len(priced) < len(flows):
+            lines.append(f"• {len(flows) - len(priced)} older txs without a price")
+        return "\n".join(lines)
+
+    @staticmethod
+    def format_price_quote(quote) -> str:
+        """Show the BTC price, with its age once it is no longer fresh"""
+        if quote is None:
+            return "unavailable"
+        if quote.age < PRICE_CACHE_TTL:
+            return f"${quote.price:,.2f}"
+        minutes = int(quote.age // 60)
+        age_text = f"{minutes}m" if minutes else f"{int(quote.age)}s"
+        return f"${quote.price:,.2f} (as of {age_text} ago)"
+
+async def send_watch_notification(chat_id: int, address: str, old: tuple, new: tuple):
+    """Tell a subscriber that a watched address has new activity"""
+    old_chain, old_mempool, old_balance = old
+    new_chain, new_mempool, new_balance = new
+    delta = new_balance - old_balance
+    price_quote = await BitcoinAnalyzer.get_btc_price()
+    btc_price = price_quote.price if price_quote else None
+    
+    text = f"🔔 **Wallet Activity**\n\n`{address}`\n\n"
+    if new_mempool > old_mempool:
+        text += f"⏳ {new_mempool - old_mempool} new unconfirmed transaction(s)\n"
+    if new_chain > old_chain:
+        text += f"✅ {new_chain - old_chain} new confirmed transaction(s)\n"
+    if delta:
+        sign = "+" if delta > 0 else "-"
+        text += f"{'📈' if delta > 0 else '📉'} {sign}{BitcoinAnalyzer.format_btc(abs(delta))} ({sign}{BitcoinAnalyzer.format_usd(abs(delta), btc_price)})\n"
+    text += f"\n💰 **Balance:** {BitcoinAnalyzer.format_btc(new_balance)} ({BitcoinAnalyzer.format_usd(new_balance, btc_price)})"
+    
+    keyboard = [[InlineKeyboardButton("🔍 Analyze", callback_data=f"refresh_{address}")]]
+    await telegram_app.bot.send_message(
+        chat_id, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown'
+    )
+
+batch_scheduler = BoundedScheduler(BATCH_CONCURRENCY, BATCH_PER_HOST_CONCURRENCY)
+chain_pool = ProviderPool([BLOCKSTREAM_API] + ESPLORA_FALLBACK_APIS)
+# The upstream budgets are for the whole deployment, so sharded workers split them
+for provider in chain_pool.providers:
+    outbound.configure_host(provider.host, CHAIN_API_RATE / SHARD_COUNT, max(CHAIN_API_BURST / SHARD_COUNT, 1))
+outbound.configure_host(
+    urlparse(COINGECKO_API).netloc, PRICE_API_RATE / SHARD_COUNT, max(PRICE_API_BURST / SHARD_COUNT, 1)
+)
+price_cache = PriceCache(BitcoinAnalyzer.fetch_btc_price, PRICE_CACHE_TTL, PRICE_STALE_TTL)
+price_history = PriceHistory(
+    BitcoinAnalyzer.fetch_price_range,
+    os.path.join(DATA_DIR, 'btc_usd_daily.bin'),
+    PRICE_HISTORY_MAX_DAYS
+)
+fee_estimates = FeeEstimateCache(BitcoinAnalyzer.fetch_fee_estimates, FEE_ESTIMATE_TTL)
+tx_history = TxHistoryFetcher(
+    BitcoinAnalyzer.fetch_raw,
+    HISTORY_MAX_PAGES,
+    HISTORY_MAX_BYTES,
+    HISTORY_CONCURRENCY
+)
+address_cache = AddressCache(
+    ADDRESS_CACHE_MAX_ENTRIES,
+    ADDRESS_CACHE_MAX_BYTES,
+    ADDRESS_CACHE_CONFIRMED_TTL,
+    ADDRESS_CACHE_MEMPOOL_TTL
+)
+inflight = InFlightTracker(MAX_ANALYSES_PER_USER)
+wallet_watcher = WalletWatcher(
+    BitcoinAnalyzer.fetch_chain_json,
+    BitcoinAnalyzer.fetch_raw,
+    BitcoinAnalyzer.fetch_stream,
+    send_watch_notification,
+    on_change=lambda address: address_cache.invalidate(validate_address(address).cache_key),
+    poll_interval=WATCH_POLL_INTERVAL,
+    sweep_batch=WATCH_SWEEP_BATCH,
+    concurrency=WATCH_CONCURRENCY,
+    # The polling shard picks up watches that other workers add and remove
+    load_subscriptions=(lambda: state_backend.load_watches()) if SHARD_COUNT > 1 and polls_watches() else None
+)
+
+analysis_stage_seconds = registry.histogram(
+    'btcbot_analysis_stage_seconds', 'Time spent in each stage of a single-address analysis', ('stage',)
+)
+analyses_total = registry.counter('btcbot_analyses_total', 'Finished single-address analyses by outcome', ('outcome',))
+handler_errors = registry.counter('btcbot_handler_errors_total', 'Exceptions that reached the error handler', ('type',))
+rate_limit_rejections = registry.counter('btcbot_rate_limit_rejections_total', 'Requests refused by the rate limiter', ('kind',))
+registry.callback(
+    'btcbot_cache_events_total', 'Cache lookups and upstream refreshes', 'counter', ('cache', 'event'),
+    lambda: {
+        **{('price', event): value for event, value in price_cache.stats.items()},
+        **{('address', event): value for event, value in address_cache.stats.items()},
+        **{('fee_estimates', event): value for event, value in fee_estimates.stats.items()}
+    }
+)
+registry.callback(
+    'btcbot_chain_provider_breaker_open', '1 while the provider\'s circuit breaker is not closed', 'gauge', ('host',),
+    lambda: {(provider.host,): int(provider.breaker.state != 'closed') for provider in chain_pool.providers}
+)
+registry.callback(
+    'btcbot_outbound_waiting', 'Requests queued for an outbound token', 'gauge', ('host',),
+    lambda: {(host,): bucket.depth() for host, bucket in outbound.buckets.items()}
+)
+registry.callback(
+    'btcbot_outbound_shed_total', 'Outbound requests shed because the queue was full', 'counter', ('host',),
+    lambda: {(host,): bucket.stats['shed'] for host, bucket in outbound.buckets.items()}
+)
+registry.callback(
+    'btcbot_http_connections_total', 'Upstream connections opened or reused', 'counter', ('event',),
+    lambda: {('created',): HttpClient.stats['connections_created'], ('reused',): HttpClient.stats['connections_reused']}
+)
+registry.callback(
+    'btcbot_updates_total', 'Telegram updates processed', 'counter', (),
+    lambda: {(): liveness.stats['updates']}
+)
+registry.callback(
+    'btcbot_startup_seconds', 'Seconds from process start until each startup phase was reached', 'gauge', ('phase',),
+    lambda: {(phase,): seconds for phase, seconds in liveness.startup.items()}
+)
+registry.callback(
+    'btcbot_watched_addresses', 'Addresses with at least one watch subscriber', 'gauge', (),
+    lambda: {(): len(wallet_watcher)}
+)
+
+async def timed(stage: str, awaitable):
+    """Await `awaitable`, recording its duration as an analysis stage"""
+    with analysis_stage_seconds.time(stage):
+        return await awaitable
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command handler"""
     user_id = update.effective_user.id
@@ -283,12 +907,21 @@ Just paste any Bitcoin address - I'll analyze it instantly!
 • All Bitcoin address types
 • Legacy, SegWit, and Bech32
 
-**4. Privacy:**
-• No data stored
+**4. Batch Mode:**
+• `/batch` + up to {BATCH_MAX_ADDRESSES} addresses, or paste several at once
+• Every {BATCH_ADDRESSES_PER_REQUEST} addresses count as one request
+
+**5. Watch Mode:**
+• `/watch` + address to get notified of new activity
+• `/unwatch` + address to stop, `/watchlist` to see yours
+• Notifications don't count against your limits
+
+**6. Privacy:**
+• No data stored except the addresses you watch
 • Real-time analysis only
 • Your addresses aren't logged
 
-**5. Rate Limits:**
+**7. Rate Limits:**
 • {RATE_LIMIT_PER_HOUR}/hour, {RATE_LIMIT_PER_DAY}/day
 • Keeps service free for all users
         """
@@ -344,12 +977,13 @@ Thank you for your support! 🙏
         address = query.data.replace("refresh_", "")
         class FakeMessage:
             text = address
+            reply_text = query.message.reply_text
         class FakeUpdate:
             message = FakeMessage()
             effective_user = query.from_user
         
         fake_update = FakeUpdate()
-        await analyze_address(fake_update, context)
+        await analyze_address(fake_update, context, force_refresh=True)
 
 async def start_menu(query):
     """Show the main menu"""
@@ -385,14 +1019,280 @@ Just send me any Bitcoin address to get started!
     
     await query.edit_message_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Analyze a Bitcoin address with rate limiting"""
+BUSY_TEXT = (
+    "🚦 **Service Busy**\n\n"
+    "Too many analyses are queued right now. Please try again in a minute.\n"
+    "This request was not counted against your limit."
+)
+
+ALREADY_RUNNING_TEXT = (
+    "⏳ **Already Analyzing**\n\n"
+    "This address is still being analyzed; the result will appear in the message above.\n"
+    "This request was not counted against your limit."
+)
+
+AT_CAPACITY_TEXT = (
+    "⏳ **Analyses Running**\n\n"
+    f"You already have {MAX_ANALYSES_PER_USER} analyses running. Please wait for one to finish.\n"
+    "This request was not counted against your limit."
+)
+
+def split_addresses(text: str) -> list:
+    """Split pasted text into addresses (newlines, spaces, commas or semicolons)"""
+    return [token for token in re.split(r'[\s,;]+', text) if token]
+
+def short_address(address: str) -> str:
+    return f"{address[:8]}…{address[-6:]}"
+
+def render_batch(addresses: list, results: dict, btc_price: float, done: bool) -> str:
+    """Progress/summary text for a batch, kept under Telegram's message size limit"""
+    finished = [address for address in addresses if address in results]
+    text = f"📦 **Batch Analysis** ({len(finished)}/{len(addresses)})\n"
+    if not done:
+        text += "⏳ Fetching data...\n"
+    text += "\n"
+    
+    lines = []
+    total_balance = 0
+    total_txs = 0
+    failed = 0
+    for address in finished:
+        wallet_data = results[address]
+        if not wallet_data:
+            failed += 1
+            lines.append(f"❌ `{short_address(address)}` failed")
+            continue
+        chain_stats = wallet_data['address_data'].get('chain_stats', {})
+        balance = chain_stats.get('funded_txo_sum', 0) - chain_stats.get('spent_txo_sum', 0)
+        total_balance += balance
+        total_txs += chain_stats.get('tx_count', 0)
+        lines.append(f"✅ `{short_address(address)}` {BitcoinAnalyzer.format_btc(balance)}")
+    
+    shown = []
+    length = len(text)
+    for line in lines:
+        if length + len(line) > 3300:
+            shown.append(f"…and {len(lines) - len(shown)} more")
+            break
+        shown.append(line)
+        length += len(line) + 1
+    text += "\n".join(shown)
+    
+    if done:
+        text += (
+            f"\n\n💰 **Total:** {BitcoinAnalyzer.format_btc(total_balance)} "
+            f"({BitcoinAnalyzer.format_usd(total_balance, btc_price)})\n"
+            f"🔄 **Transactions:** {total_txs:,}"
+        )
+        if failed:
+            text += f"\n⚠️ {failed} address(es) could not be fetched"
+    return text
+
+async def run_batch(update: Update, addresses: list):
+    """Analyze many addresses at once, streaming results into one message"""
     user_id = update.effective_user.id
-    address = update.message.text.strip()
+    addresses = list(dict.fromkeys(addresses))
     
+    if len(addresses) > BATCH_MAX_ADDRESSES:
+        await update.message.reply_text(
+            f"❌ **Too Many Addresses**\n\nA batch can hold up to {BATCH_MAX_ADDRESSES} addresses.",
+            parse_mode='Markdown'
+        )
+        return
+    
+    invalid = [address for address in addresses if not is_valid_address(address)]
+    if invalid:
+        await update.message.reply_text(
+            "❌ **Invalid Bitcoin Address**\n\n"
+            # A backtick cannot be escaped inside a code span, so it is dropped from the echo
+            + "\n".join(f"• `{address[:40].replace('`', '')}`" for address in invalid[:10])
+            + "\n\nFix these and send the batch again. Nothing was charged.",
+            parse_mode='Markdown'
+        )
+        return
+    
+    addresses = list(dict.fromkeys(validate_address(address).address for address in addresses))
+    
+    # One rate-limit slot covers BATCH_ADDRESSES_PER_REQUEST addresses
+    slots = math.ceil(len(addresses) / BATCH_ADDRESSES_PER_REQUEST)
     rate_info = RateLimiter.check_user_limit(user_id)
+    available = min(rate_info['hourly_remaining'], rate_info['daily_remaining'])
+    if slots > available:
+        rate_limit_rejections.inc('batch')
+        await update.message.reply_text(
+            f"⚠️ **Rate Limit Reached**\n\n"
+            f"This batch needs {slots} requests ({BATCH_ADDRESSES_PER_REQUEST} addresses each), "
+            f"but you have {max(available, 0)} left.\n"
+            f"You can send up to {max(available, 0) * BATCH_ADDRESSES_PER_REQUEST} addresses now.",
+            parse_mode='Markdown'
+        )
+        return
+    if outbound.is_saturated(chain_pool.providers[0].host):
+        await update.message.reply_text(BUSY_TEXT, parse_mode='Markdown')
+        return
+    
+    claim = inflight.claim(user_id, 'batch')
+    if claim != CLAIMED:
+        text = ALREADY_RUNNING_TEXT if claim == DUPLICATE else AT_CAPACITY_TEXT
+        await update.message.reply_text(text, parse_mode='Markdown')
+        return
+    try:
+        for _ in range(slots):
+            RateLimiter.record_request(user_id)
+        await stream_batch(update, addresses)
+    finally:
+        inflight.release(user_id, 'batch')
+
+async def stream_batch(update: Update, addresses: list):
+    """Fetch a validated, already charged batch and stream results into one message"""
+    results = {}
+    price_task = asyncio.create_task(BitcoinAnalyzer.get_btc_price())
+    progress_msg = await update.message.reply_text(
+        render_batch(addresses, results, None, done=False), parse_mode='Markdown'
+    )
+    
+    host = urlparse(BLOCKSTREAM_API).netloc
+    jobs = [
+        (address, host, lambda address=address: BitcoinAnalyzer.get_address_info(
+            address, cache_key=validate_address(address).cache_key, walk_history=False
+        ))
+        for address in addresses
+    ]
+    last_edit = time.monotonic()
+    async for address, wallet_data, error in batch_scheduler.stream(jobs):
+        if error is not None:
+            print(f"Error analyzing {address}: {error}")
+        results[address] = wallet_data
+        if time.monotonic() - last_edit >= BATCH_EDIT_INTERVAL and len(results) < len(addresses):
+            last_edit = time.monotonic()
+            try:
+                await progress_msg.edit_text(render_batch(addresses, results, None, done=False), parse_mode='Markdown')
+            except BadRequest:
+                pass
+    
+    price_quote = await price_task
+    keyboard = [
+        [InlineKeyboardButton("🔍 New Analysis", callback_data="start_analysis"),
+         InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
+    ]
+    await progress_msg.edit_text(
+        render_batch(addresses, results, price_quote.price if price_quote else None, done=True),
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode='Markdown'
+    )
+
+async def batch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/batch <address> <address> ... — analyze several addresses at once"""
+    addresses = split_addresses(" ".join(context.args or []))
+    if not addresses:
+        await update.message.reply_text(
+            "📦 **Batch Analysis**\n\n"
+            f"Send `/batch` followed by up to {BATCH_MAX_ADDRESSES} addresses, "
+            "separated by spaces or new lines.\n"
+            "You can also just paste several addresses in one message.\n\n"
+            f"Every {BATCH_ADDRESSES_PER_REQUEST} addresses count as one request.",
+            parse_mode='Markdown'
+        )
+        return
+    await run_batch(update, addresses)
+
+def parse_watch_argument(context: ContextTypes.DEFAULT_TYPE):
+    """Validated mainnet address from a /watch or /unwatch argument (None if missing)"""
+    if not context.args:
+        return None
+    parsed = validate_address(context.args[0])
+    if parsed.network != 'mainnet':
+        raise InvalidAddressError(f"{parsed.network} addresses are not supported")
+    return parsed.address
+
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/watch <address> — get notified when an address has new activity"""
+    chat_id = update.effective_chat.id
+    try:
+        address = parse_watch_argument(context)
+    except InvalidAddressError as e:
+        await update.message.reply_text(
+            f"❌ **Invalid Bitcoin Address**\n\n{escape_markdown(str(e), version=1)}.", parse_mode='Markdown'
+        )
+        return
+    if address is None:
+        await update.message.reply_text(
+            "👁 **Watch Mode**\n\n"
+            "Send `/watch` followed by an address and I'll message you when it sends or receives funds.\n"
+            f"You can watch up to {WATCH_MAX_PER_CHAT} addresses. Notifications don't count against your limits.",
+            parse_mode='Markdown'
+        )
+        return
+    
+    watched = wallet_watcher.addresses_for(chat_id)
+    if address not in watched and len(watched) >= WATCH_MAX_PER_CHAT:
+        await update.message.reply_text(
+            f"⚠️ You are already watching {WATCH_MAX_PER_CHAT} addresses. Use `/unwatch` to free a slot.",
+            parse_mode='Markdown'
+        )
+        return
+    
+    if not wallet_watcher.subscribe(chat_id, address):
+        await update.message.reply_text(f"👁 Already watching `{address}`.", parse_mode='Markdown')
+        return
+    state_backend.record_watch(chat_id, address, True)
+    
+    try:
+        # Take the baseline snapshot now so the first change is reported
+        await wallet_watcher.check_address(address)
+    except Exception as e:
+        print(f"Error taking watch snapshot for {address}: {e}")
+    
+    await update.message.reply_text(
+        f"👁 **Watching** `{address}`\n\n"
+        "I'll message you when it has new transactions.",
+        parse_mode='Markdown'
+    )
+
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/unwatch <address> — stop watching an address"""
+    chat_id = update.effective_chat.id
+    try:
+        address = parse_watch_argument(context)
+    except InvalidAddressError as e:
+        await update.message.reply_text(
+            f"❌ **Invalid Bitcoin Address**\n\n{escape_markdown(str(e), version=1)}.", parse_mode='Markdown'
+        )
+        return
+    if address is None:
+        await update.message.reply_text("Send `/unwatch` followed by a watched address.", parse_mode='Markdown')
+        return
+    
+    if wallet_watcher.unsubscribe(chat_id, address):
+        state_backend.record_watch(chat_id, address, False)
+        await update.message.reply_text(f"🔕 Stopped watching `{address}`.", parse_mode='Markdown')
+    else:
+        await update.message.reply_text(f"You are not watching `{address}`.", parse_mode='Markdown')
+
+async def watchlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/watchlist — show the addresses this chat watches"""
+    addresses = wallet_watcher.addresses_for(update.effective_chat.id)
+    if not addresses:
+        await update.message.reply_text("You are not watching any addresses. Use `/watch <address>`.", parse_mode='Markdown')
+        return
+    
+    text = f"👁 **Watched Addresses** ({len(addresses)}/{WATCH_MAX_PER_CHAT})\n"
+    for address in addresses:
+        snapshot = wallet_watcher.snapshots.get(address)
+        balance = BitcoinAnalyzer.format_btc(snapshot[2]) if snapshot else "pending"
+        text += f"\n• `{address}`\n  {balance}"
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE, force_refresh: bool = False):
+    """Analyze a Bitcoin address with rate limiting (force_refresh skips the address cache)"""
+    user_id = update.effective_user.id
+    address = update.message.text.strip()
+    
+    with analysis_stage_seconds.time('rate_limit'):
+        rate_info = RateLimiter.check_user_limit(user_id)
     
     if not rate_info['can_proceed']:
+        rate_limit_rejections.inc('single')
         limit_text = f"⚠️ **Rate Limit Reached**\n\n"
         if rate_info['hourly_used'] >= RATE_LIMIT_PER_HOUR:
             limit_text += f"You've used all {RATE_LIMIT_PER_HOUR} hourly requests. Try again in 1 hour."
@@ -405,34 +1305,79 @@ async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(limit_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
         return
     
-    if not (address.startswith('1') or address.startswith('3') or address.startswith('bc1')):
+    if len(split_addresses(address)) > 1:
+        await run_batch(update, split_addresses(address))
+        return
+    
+    try:
+        with analysis_stage_seconds.time('validation'):
+            parsed = validate_address(address)
+        if parsed.network != 'mainnet':
+            raise InvalidAddressError(f"{parsed.network} addresses are not supported")
+    except InvalidAddressError as e:
+        analyses_total.inc('invalid')
         await update.message.reply_text(
             "❌ **Invalid Bitcoin Address**\n\n"
-            "Please send a valid Bitcoin address (starts with 1, 3, or bc1)\n\n"
+            f"Please send a valid Bitcoin address ({escape_markdown(str(e), version=1)}).\n\n"
             f"⚡ **Remaining:** {rate_info['hourly_remaining']} this hour",
             parse_mode='Markdown'
         )
         return
     
+    if outbound.is_saturated(chain_pool.providers[0].host):
+        analyses_total.inc('busy')
+        await update.message.reply_text(BUSY_TEXT, parse_mode='Markdown')
+        return
+    
+    # A repeated paste or refresh tap joins the analysis already running for it
+    claim = inflight.claim(user_id, parsed.cache_key)
+    if claim == DUPLICATE:
+        analyses_total.inc('deduplicated')
+        if not force_refresh:
+            await update.message.reply_text(ALREADY_RUNNING_TEXT, parse_mode='Markdown')
+        return
+    if claim != CLAIMED:
+        analyses_total.inc('at_capacity')
+        await update.message.reply_text(AT_CAPACITY_TEXT, parse_mode='Markdown')
+        return
+    try:
+        await run_analysis(update, parsed, force_refresh)
+    finally:
+        inflight.release(user_id, parsed.cache_key)
+
+async def run_analysis(update: Update, parsed, force_refresh: bool):
+    """Charge one request and analyze a validated address; the caller holds its in-flight claim"""
+    user_id = update.effective_user.id
+    address = parsed.address
+    
     RateLimiter.record_request(user_id)
     rate_info = RateLimiter.check_user_limit(user_id)
     
-    analyzing_msg = await update.message.reply_text(
-        f"🔍 **Analyzing Wallet**\n"
-        f"⏳ Fetching data...\n\n"
-        f"⚡ **After this:** {rate_info['hourly_remaining']} requests remaining", 
-        parse_mode='Markdown'
-    )
+    position = outbound.queue_position(chain_pool.providers[0].host)
+    status_line = f"⏳ Busy, queued at position {position}..." if position else "⏳ Fetching data..."
+    with analysis_stage_seconds.time('telegram_reply'):
+        analyzing_msg = await update.message.reply_text(
+            f"🔍 **Analyzing Wallet**\n"
+            f"{status_line}\n\n"
+            f"⚡ **After this:** {rate_info['hourly_remaining']} requests remaining", 
+            parse_mode='Markdown'
+        )
     
     analyzer = BitcoinAnalyzer()
+    started = time.perf_counter()
     
     try:
-        btc_price_task = analyzer.get_btc_price()
-        wallet_data_task = analyzer.get_address_info(address)
+        btc_price_task = timed('price', analyzer.get_btc_price())
+        wallet_data_task = timed(
+            'address_info',
+            analyzer.get_address_info(address, bypass_cache=force_refresh, cache_key=parsed.cache_key)
+        )
         
-        btc_price, wallet_data = await asyncio.gather(btc_price_task, wallet_data_task)
+        price_quote, wallet_data = await asyncio.gather(btc_price_task, wallet_data_task)
+        btc_price = price_quote.price if price_quote else None
         
         if not wallet_data:
+            analyses_total.inc('not_found')
             keyboard = [[InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]]
             await analyzing_msg.edit_text(
                 "❌ **Analysis Failed**\n\n"
@@ -443,8 +1388,21 @@ async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        address_data = wallet_data['address_data']
         transactions = wallet_data['transactions']
+        # Prices at each transaction's time; once the local series is warm this makes no request
+        tx_prices = await timed('price_history', price_history.prices_at(
+            [tx.get('status', {}).get('block_time') for tx in transactions]
+        ))
+        # Today's (and unconfirmed) transactions are valued at the current price
+        today = int(time.time() // 86400)
+        tx_prices = [
+            btc_price if price is None and (not tx.get('status', {}).get('block_time')
+                                            or tx['status']['block_time'] // 86400 == today) else price
+            for tx, price in zip(transactions, tx_prices)
+        ]
+        
+        formatting_started = time.perf_counter()
+        address_data = wallet_data['address_data']
         utxos = wallet_data['utxos']
         
         balance = address_data.get('chain_stats', {}).get('funded_txo_sum', 0) - address_data.get('chain_stats', {}).get('spent_txo_sum', 0)
@@ -452,6 +1410,18 @@ async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
         total_sent = address_data.get('chain_stats', {}).get('spent_txo_sum', 0)
         tx_count = address_data.get('chain_stats', {}).get('tx_count', 0)
         
+        # A background walk may have got further than the cached answer
+        cursor = tx_history.get_cursor(address)
+        history = cursor.summary() if cursor is not None else wallet_data.get('history')
+        if history and history['first_tx_time']:
+            first_tx_text = datetime.fromtimestamp(history['first_tx_time']).strftime('%Y-%m-%d')
+            if not history['complete']:
+                first_tx_text += " (or earlier)"
+        elif transactions and transactions[-1].get('status', {}).get('block_time'):
+            first_tx_text = datetime.fromtimestamp(transactions[-1]['status']['block_time']).strftime('%Y-%m-%d')
+        else:
+            first_tx_text = 'N/A'
+        
         analysis_text = f"""
 📊 **Wallet Analysis**
 
@@ -461,56 +1431,35 @@ async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Current: {analyzer.format_btc(balance)} ({analyzer.format_usd(balance, btc_price)})
 • Received: {analyzer.format_btc(total_received)} ({analyzer.format_usd(total_received, btc_price)})
 • Sent: {analyzer.format_btc(total_sent)} ({analyzer.format_usd(total_sent, btc_price)})
+• BTC Price: {analyzer.format_price_quote(price_quote)}
 
 📈 **Activity:**
 • Transactions: {tx_count:,}
-• UTXOs: {len(utxos)}
-• First TX: {datetime.fromtimestamp(transactions[-1]['status']['block_time']).strftime('%Y-%m-%d') if transactions and transactions[-1].get('status', {}).get('block_time') else 'N/A'}
+• UTXOs: {utxos['count']:,}{'+' if utxos['truncated'] else ''}
+• First TX: {first_tx_text}
 • Last TX: {datetime.fromtimestamp(transactions[0]['status']['block_time']).strftime('%Y-%m-%d') if transactions and transactions[0].get('status', {}).get('block_time') else 'N/A'}
-
-🔄 **Recent Transactions:**
         """
         
+        if wallet_data.get('utxo_summary') and utxos['count']:
+            analysis_text += f"\n🧱 **UTXO Set:**\n{analyzer.format_utxo_summary(wallet_data['utxo_summary'], btc_price)}\n"
+        
+        flows = net_flows(transactions, address)
+        if transactions:
+            analysis_text += f"\n💵 **USD at Transaction Time:**\n{analyzer.format_realized_flows(flows, tx_prices, btc_price)}\n"
+        
+        analysis_text += "\n🔄 **Recent Transactions:**\n"
+        
         # Recent transactions analysis
         if transactions:
-            for i, tx in enumerate(transactions[:3]):
+            recent = transactions[:3]
+            for tx, (value_received, value_sent, net_value), tx_price in zip(recent, flows, tx_prices):
                 # Time info
                 if tx.get('status', {}).get('block_time'):
                     tx_time = datetime.fromtimestamp(tx['status']['block_time']).strftime('%m/%d %H:%M')
                 else:
                     tx_time = 'Pending'
                 
-                # Amount received (outputs)
-                value_received = 0
-                for vout in tx['vout']:
-                    addr_list = vout.get('scriptpubkey_address', [])
-                    if isinstance(addr_list, str):
-                        addr_list = [addr_list]
-                    elif addr_list is None:
-                        addr_list = []
-                    
-                    if address in addr_list:
-                        value_received += vout['value']
-                
-                # Amount sent (inputs)
-                value_sent = 0
-                for vin in tx['vin']:
-                    prevout = vin.get('prevout', {})
-                    if prevout:
-                        prev_addr = prevout.get('scriptpubkey_address')
-                        if isinstance(prev_addr, str):
-                            prev_addr_list = [prev_addr]
-                        elif isinstance(prev_addr, list):
-                            prev_addr_list = prev_addr
-                        else:
-                            prev_addr_list = []
-                        
-                        if address in prev_addr_list:
-                            value_sent += prevout.get('value', 0)
-                
                 # Net amount and direction
-                net_value = value_received - value_sent
-                
                 if net_value > 0:
                     direction = "📈 Received"
                     amount_text = analyzer.format_btc(net_value)
@@ -524,11 +1473,17 @@ async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 # TX ID (shortened)
                 tx_id_short = tx['txid'][:8] + "..." + tx['txid'][-8:]
                 
+                if tx_price is not None and (net_value or value_received):
+                    amount_text += f" ({analyzer.format_usd(abs(net_value) or value_received, tx_price)})"
+                
                 analysis_text += f"\n• {direction} {amount_text} - {tx_time}"
                 analysis_text += f"\n  TX: `{tx_id_short}`"
         else:
             analysis_text += "\n• No transactions found"
 
+        if wallet_data['partial']:
+            analysis_text += f"\n\n⚠️ _Partial data: {', '.join(wallet_data['partial'])} unavailable_"
+
         analysis_text += "\n"
         
         keyboard = [
@@ -538,10 +1493,33 @@ async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
              InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
+        analysis_stage_seconds.observe(time.perf_counter() - formatting_started, 'formatting')
         
-        await analyzing_msg.edit_text(analysis_text, reply_markup=reply_markup, parse_mode='Markdown')
+        with analysis_stage_seconds.time('telegram_edit'):
+            await analyzing_msg.edit_text(analysis_text, reply_markup=reply_markup, parse_mode='Markdown')
+        analysis_stage_seconds.observe(time.perf_counter() - started, 'total')
+        analyses_total.inc('partial' if wallet_data['partial'] else 'ok')
         
+        if transactions and not (history and history['complete']):
+            with background_lane():
+                tx_history.continue_walk(address)
+        
+    except SchedulerBusy:
+        analyses_total.inc('busy')
+        keyboard = [[InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]]
+        await analyzing_msg.edit_text(BUSY_TEXT, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    except UpstreamUnavailable:
+        analyses_total.inc('unavailable')
+        keyboard = [[InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]]
+        await analyzing_msg.edit_text(
+            "⚠️ **Data Provider Unavailable**\n\n"
+            "Blockchain data sources are not responding right now. Please try again in a minute.\n"
+            f"⚡ **Remaining:** {rate_info['hourly_remaining']} this hour",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
     except Exception as e:
+        analyses_total.inc('error')
         keyboard = [[InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]]
         await analyzing_msg.edit_text(
             f"❌ **Error:** {str(e)}\n\n"
@@ -552,31 +1530,263 @@ async def analyze_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
+    handler_errors.inc(type(context.error).__name__)
     print(f"Error: {context.error}")
 
-def run_flask():
-    """Run Flask app in a separate thread"""
-    port = int(os.getenv('PORT', 10000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+async def track_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs before every other handler so /health knows when the last update was processed"""
+    liveness.record_update()
+    if liveness.stats['updates'] == 1:
+        print(f"⏱ First update {liveness.startup['first_update']:.2f}s after process start ({format_startup()})")
 
-def main():
-    """Start the bot and Flask server"""
-    # Start Flask server in a separate thread
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
+# Long-running tasks started in on_startup and cancelled in on_shutdown
+background_tasks = []
+
+# Set once the warm-up has reloaded the cache snapshots
+caches_restored = False
+
+async def open_state():
+    """Open the persistence backend and reload what the first update needs: the rate limits"""
+    global state_backend
+    state_backend = create_backend(STATE_BACKEND, DATA_DIR)
+    await state_backend.open()
+    restored = await RateLimiter.restore(state_backend)
+    
+    if SHARD_COUNT > 1:
+        # Workers fill and read each other's price and address lookups through the backend
+        price_cache.shared = state_backend
+        address_cache.shared = state_backend
+    return restored
+
+async def restore_caches():
+    """Reload cached data and watches; runs while updates are already being served"""
+    global caches_restored
+    quote = await state_backend.load_value('btc_price')
+    if quote:
+        price_cache.restore(quote['price'], quote['fetched_at'])
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    snapshot = await state_backend.load_value(state_key('address_cache'))
+    if snapshot:
+        entries = snapshot['entries']
+        # In slices, so that a large snapshot does not stall the handlers
+        for start in range(0, len(entries), CACHE_RESTORE_SLICE):
+            address_cache.restore(entries[start:start + CACHE_RESTORE_SLICE], elapsed=time.time() - snapshot['saved_at'])
+            await asyncio.sleep(0)
+    
+    cursors = await state_backend.load_value(state_key('tx_history'))
+    if cursors:
+        tx_history.restore(cursors)
+    
+    for chat_id, address in await state_backend.load_watches():
+        if owns_user(chat_id) or polls_watches():
+            wallet_watcher.subscribe(chat_id, address)
+    watches = await state_backend.load_value(state_key('watches'))
+    if watches:
+        # Snapshots written before watches had their own table carry the subscriptions
+        for address, chats in watches.get('subscriptions', {}).items():
+            for chat_id in chats:
+                if wallet_watcher.subscribe(chat_id, address):
+                    state_backend.record_watch(chat_id, address, True)
+        wallet_watcher.restore(watches)
+    caches_restored = True
+
+async def warm_up(rate_events: int):
+    """Everything the bot can do without: caches, background refreshers, connections, the webhook"""
+    await HttpClient.start()
+    if BOT_MODE == 'webhook':
+        try:
+            await set_webhook(telegram_app.bot)
+        except Exception as e:
+            print(f"Error setting webhook: {e}")
+    await restore_caches()
+    print(f"💾 State backend: {STATE_BACKEND} ({rate_events} rate-limit events, "
+          f"{len(address_cache)} cached addresses, {len(wallet_watcher)} watched addresses restored)")
+    
+    price_cache.start_refresher(PRICE_REFRESH_INTERVAL)
+    if polls_watches():
+        wallet_watcher.start()
+    # Fills the fee snapshot and opens a pooled connection to the chain provider
+    warm_ups = [price_cache.get(), fee_estimates.get(), asyncio.to_thread(load_numpy)]
+    # Workers share the price history file, so one of them fetching it is enough
+    if SHARD_INDEX == 0:
+        warm_ups.append(price_history.warm(PRICE_HISTORY_WARM_DAYS))
+    for result in await asyncio.gather(*warm_ups, return_exceptions=True):
+        if isinstance(result, Exception):
+            print(f"Error during warm-up: {result}")
+    print(f"⏱ Warm {liveness.mark_startup('warm'):.2f}s after process start ({format_startup()})")
+
+def format_startup() -> str:
+    return ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in liveness.startup.items())
+
+async def save_state():
+    """Snapshot the caches and flush everything to the persistence backend"""
+    if price_cache.quote is not None:
+        state_backend.save_value('btc_price', price_cache.quote._asdict())
+    # Until the snapshots are restored, saving would replace them with near-empty ones
+    if caches_restored:
+        state_backend.save_value(state_key('address_cache'), {
+            'saved_at': time.time(),
+            'entries': address_cache.snapshot()
+        })
+        state_backend.save_value(state_key('tx_history'), tx_history.snapshot())
+        state_backend.save_value(state_key('watches'), wallet_watcher.snapshot())
+    await state_backend.close()
+
+async def on_startup(application: Application):
+    """Open what handlers need before the first update, then warm up the rest in the background"""
+    global telegram_app
+    telegram_app = application
+    liveness.start()
+    await start_web_server()
+    rate_events = await open_state()
+    # Updates are answered while the warm-up is still going
+    with background_lane():
+        background_tasks.append(asyncio.create_task(warm_up(rate_events)))
+    background_tasks.append(asyncio.create_task(RateLimiter.run_evictor()))
+
+async def on_shutdown(application: Application):
+    """Release shared resources after the bot stops"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await price_cache.stop_refresher()
+    await wallet_watcher.stop()
+    await tx_history.stop()
+    await save_state()
+    stats = HttpClient.stats
+    print(f"🔌 HTTP pool: {stats['connections_created']} connections opened, "
+          f"{stats['connections_reused']} reused ({HttpClient.reuse_ratio():.0%})")
+    await HttpClient.close()
+    await stop_web_server()
+    await liveness.stop()
+
+async def run_webhook(application: Application):
+    """Run the bot on updates pushed to WEBHOOK_PATH of the health server"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
     
+    global telegram_app
+    telegram_app = application
+    # Listen first: health checks pass sooner, and updates pushed during startup
+    # wait in the update queue (the webhook itself is (re)registered by the warm-up)
+    await start_web_server()
+    # Driven by hand (PTB's webhook server would need a second port), in run_polling's order
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    print(f"⏱ Ready {liveness.mark_startup('ready'):.2f}s after process start")
+    try:
+        await stop.wait()
+    finally:
+        # stop() lets the update queue and running handlers finish before state is saved
+        await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+async def set_webhook(bot):
+    await bot.set_webhook(
+        url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+        allowed_updates=ALLOWED_UPDATES,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS
+    )
+
+async def run_sharded(application: Application):
+    """Receive webhook updates and fan them out to SHARD_WORKERS worker processes"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    # Worker i owns the users with user_id % SHARD_WORKERS == i; workers share state through SQLite
+    worker_ports = [WORKER_BASE_PORT + index for index in range(SHARD_WORKERS)]
+    supervisor = WorkerSupervisor(
+        SHARD_WORKERS,
+        [sys.executable, os.path.abspath(__file__)],
+        lambda index: dict(
+            os.environ, BOT_MODE='worker', STATE_BACKEND='sqlite', SHARD_INDEX=str(index),
+            SHARD_COUNT=str(SHARD_WORKERS), PORT=str(worker_ports[index])
+        )
+    )
+    router = ShardRouter([f"http://127.0.0.1:{port}{WEBHOOK_PATH}" for port in worker_ports], WEBHOOK_SECRET)
+    
+    async def receiver_health(request):
+        workers = await router.worker_health([f"http://127.0.0.1:{port}/health" for port in worker_ports])
+        healthy = all(worker['status'] == 200 for worker in workers) and not router.draining
+        return web.json_response({
+            'status': 'ok' if healthy else 'unhealthy',
+            'timestamp': datetime.now().isoformat(),
+            'router': router.summary(),
+            'supervisor': supervisor.summary(),
+            'workers': workers
+        }, status=200 if healthy else 503)
+    
+    receiver = web.Application()
+    receiver.router.add_post(WEBHOOK_PATH, router.handle)
+    receiver.router.add_get('/health', receiver_health)
+    receiver.router.add_get('/', home)
+    runner = web.AppRunner(receiver, access_log=None)
+    
+    await router.start()
+    await supervisor.start()
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', PORT).start()
+    try:
+        async with application.bot:
+            await set_webhook(application.bot)
+        await stop.wait()
+    finally:
+        # New updates get 503 and are redelivered by Telegram; workers finish their queues and save state
+        await router.drain(DRAIN_TIMEOUT)
+        await supervisor.stop(DRAIN_TIMEOUT)
+        await runner.cleanup()
+        await router.close()
+
+def main():
+    """Start the bot; the health server starts with it in on_startup"""
+    liveness.mark_startup('imported')
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_BASE_URL}/file/bot")
+        .concurrent_updates(UPDATE_WORKERS)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if BOT_MODE != 'polling':
+        builder = builder.updater(None)
+    application = builder.build()
+    
+    application.add_handler(TypeHandler(Update, track_update), group=-1)
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("batch", batch_command))
+    application.add_handler(CommandHandler("watch", watch_command))
+    application.add_handler(CommandHandler("unwatch", unwatch_command))
+    application.add_handler(CommandHandler("watchlist", watchlist_command))
     application.add_handler(CallbackQueryHandler(button_handler))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, analyze_address))
     application.add_error_handler(error_handler)
     
+    if BOT_MODE == 'sharded':
+        print(f"🔀 Sharded receiver on port {PORT}, {SHARD_WORKERS} workers from port {WORKER_BASE_PORT}")
+        asyncio.run(run_sharded(application))
+        return
+    
     print("🚀 Bitcoin Wallet Analyzer Bot started!")
     print(f"⚡ Rate limits: {RATE_LIMIT_PER_HOUR}/hour, {RATE_LIMIT_PER_DAY}/day")
-    print(f"🌐 Flask server running on port {os.getenv('PORT', 10000)}")
+    print(f"🌐 Health server running on port {PORT}")
+    print(f"📥 Receiving updates via {BOT_MODE} ({UPDATE_WORKERS} concurrent workers)")
+    if SHARD_COUNT > 1:
+        print(f"🔀 Shard {SHARD_INDEX} of {SHARD_COUNT}")
     
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE in ('webhook', 'worker'):
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
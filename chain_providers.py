@@ -0,0 +1,254 @@
+import asyncio
+import random
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import aiohttp
+
+from http_client import HttpClient
+from outbound_scheduler import SchedulerBusy, outbound
+
+# Per-attempt timeout; the caller's overall deadline still applies on top
+ATTEMPT_TIMEOUT = 8
+
+# Circuit breaker: open after this many consecutive failures, probe again after the cooldown
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+
+# Retries and hedges may add at most this fraction of extra requests on top of normal traffic
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MAX_TOKENS = 10
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.1
+
+# Hedge after the primary's p95 latency, clamped to this range (seconds)
+HEDGE_MIN_DELAY = 0.3
+HEDGE_MAX_DELAY = 3.0
+HEDGE_DEFAULT_DELAY = 1.0
+HEDGE_MIN_SAMPLES = 20
+
+
+class UpstreamError(Exception):
+    """A chain data provider failed to answer"""
+
+
+class UpstreamStatusError(UpstreamError):
+    def __init__(self, provider: str, status: int):
+        super().__init__(f"{provider} returned HTTP {status}")
+        self.status = status
+
+
+class UpstreamUnavailable(UpstreamError):
+    """Every provider failed, or all circuit breakers are open"""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open single probe -> closed"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        """May a request be sent now? In half-open state only one probe is let through"""
+        if self.state == 'closed':
+            return True
+        if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = 'half_open'
+            self.probing = False
+        if self.state == 'half_open' and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def available(self) -> bool:
+        """Like allow() but without claiming the half-open probe"""
+        if self.state == 'closed':
+            return True
+        if self.state == 'open':
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.probing
+
+    def release_probe(self):
+        """An in-flight probe was abandoned (e.g. a hedge won); let another one through"""
+        self.probing = False
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Token bucket that limits retries and hedges to a fraction of requests"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, max_tokens: float = RETRY_BUDGET_MAX_TOKENS):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class EsploraProvider:
+    """One Esplora-compatible API base URL with its own breaker and latency window"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.host = urlparse(self.base_url).netloc
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=200)
+        self.stats = {'requests': 0, 'failures': 0}
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        ordered = sorted(self.latencies)
+        p95 = ordered[int((len(ordered) - 1) * 0.95)]
+        return min(max(p95, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def summary(self) -> dict:
+        return dict(self.stats, base_url=self.base_url, breaker=self.breaker.state, hedge_delay=round(self.hedge_delay(), 3))
+
+
+class ProviderPool:
+    """Routes chain data requests over Esplora providers
+
+    The first provider whose breaker is closed gets the request. If it has
+    not answered after its p95 latency a hedged copy goes to the next
+    provider, and a failed attempt is retried elsewhere after a jittered
+    backoff. Retries and hedges are paid from a shared RetryBudget so an
+    outage cannot multiply upstream load.
+    """
+
+    def __init__(self, base_urls: list):
+        self.providers = [EsploraProvider(url) for url in base_urls]
+        self.budget = RetryBudget()
+        self.stats = {'requests': 0, 'hedges': 0, 'retries': 0, 'fast_failures': 0, 'unavailable': 0}
+
+    async def _attempt(self, provider: EsploraProvider, endpoint: str, path: str, handler):
+        try:
+            await outbound.acquire(provider.host)
+            session = await HttpClient.get_session()
+        except BaseException:
+            # Cancelled or shed before anything was sent: no verdict on the provider,
+            # but a half-open probe claimed by this attempt must be handed back
+            provider.breaker.release_probe()
+            raise
+        provider.stats['requests'] += 1
+        started = time.perf_counter()
+        try:
+            async with session.get(
+                f"{provider.base_url}{path}",
+                timeout=aiohttp.ClientTimeout(total=ATTEMPT_TIMEOUT)
+            ) as response:
+                HttpClient.record_status(provider.host, response.status)
+                if response.status == 429 or response.status >= 500:
+                    raise UpstreamStatusError(provider.base_url, response.status)
+                if response.status != 200:
+                    # The provider answered; the request itself is bad (e.g. unknown address)
+                    print(f"{endpoint} API error: {response.status}")
+                    result = None
+                else:
+                    result = await handler(response)
+        except asyncio.CancelledError:
+            provider.breaker.release_probe()
+            raise
+        except Exception as e:
+            if not isinstance(e, UpstreamStatusError):
+                HttpClient.record_status(provider.host, 'error')
+            provider.stats['failures'] += 1
+            provider.breaker.record_failure()
+            raise
+        elapsed = time.perf_counter() - started
+        provider.breaker.record_success()
+        provider.latencies.append(elapsed)
+        HttpClient.record_timing(endpoint, elapsed)
+        return result
+
+    async def request(self, endpoint: str, path: str, handler):
+        """GET `path` from the best provider and return `await handler(response)`
+
+        Non-200 answers other than 429/5xx return None without a retry.
+        Raises UpstreamUnavailable once every attempt has failed.
+        """
+        self.stats['requests'] += 1
+        self.budget.deposit()
+        candidates = [provider for provider in self.providers if provider.breaker.available()]
+        if not candidates:
+            self.stats['fast_failures'] += 1
+            raise UpstreamUnavailable("all chain data providers are unavailable")
+
+        pending = set()
+        errors = []
+        launched = 0
+
+        def launch() -> bool:
+            nonlocal launched
+            for offset in range(len(candidates)):
+                provider = candidates[(launched + offset) % len(candidates)]
+                if provider.breaker.allow():
+                    task = asyncio.ensure_future(self._attempt(provider, endpoint, path, handler))
+                    task.provider = provider
+                    pending.add(task)
+                    launched += 1
+                    return True
+            return False
+
+        if not launch():
+            self.stats['fast_failures'] += 1
+            raise UpstreamUnavailable("all chain data providers are unavailable")
+
+        try:
+            while pending:
+                can_hedge = launched < min(len(candidates), MAX_ATTEMPTS)
+                hedge_after = min(task.provider.hedge_delay() for task in pending) if can_hedge else None
+                done, pending = await asyncio.wait(pending, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if self.budget.withdraw() and launch():
+                        self.stats['hedges'] += 1
+                    else:
+                        # No hedge possible: just wait for what is already running
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    if isinstance(task.exception(), SchedulerBusy) and not pending:
+                        raise task.exception()
+                    errors.append(task.exception())
+
+                if not pending and launched < MAX_ATTEMPTS and self.budget.withdraw():
+                    await asyncio.sleep(random.uniform(0, RETRY_BASE_DELAY * 2 ** launched))
+                    if launch():
+                        self.stats['retries'] += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self.stats['unavailable'] += 1
+        detail = "; ".join(str(error) or type(error).__name__ for error in errors)
+        raise UpstreamUnavailable(f"chain data providers failed: {detail}")
+
+    def summary(self) -> list:
+        return [provider.summary() for provider in self.providers]
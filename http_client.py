@@ -0,0 +1,138 @@
+import aiohttp
+from collections import defaultdict, deque
+
+from metrics import registry
+
+# Connection pool settings
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 20
+HTTP_KEEPALIVE_TIMEOUT = 60
+HTTP_DNS_CACHE_TTL = 300
+
+# Number of recent samples kept per endpoint for latency percentiles
+TIMING_SAMPLES = 500
+
+HTTP_HEADERS = {
+    'User-Agent': 'Bitcoin-Analyzer-Bot/1.0',
+    'Accept': 'application/json'
+}
+
+
+upstream_seconds = registry.histogram(
+    'btcbot_upstream_request_seconds', 'Latency of upstream HTTP calls', ('endpoint',)
+)
+upstream_responses = registry.counter(
+    'btcbot_upstream_responses_total', 'Upstream HTTP responses by host and status code', ('host', 'status')
+)
+
+
+class HttpClient:
+    """Application-scoped aiohttp session shared by every upstream call"""
+
+    session = None
+    stats = {
+        'requests': 0,
+        'connections_created': 0,
+        'connections_reused': 0,
+        'dns_cache_hits': 0,
+        'dns_cache_misses': 0,
+    }
+    timings = defaultdict(lambda: deque(maxlen=TIMING_SAMPLES))
+
+    @classmethod
+    def _build_trace_config(cls) -> aiohttp.TraceConfig:
+        """Count requests, new connections and pooled connection reuse"""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            cls.stats['requests'] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            cls.stats['connections_created'] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            cls.stats['connections_reused'] += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            cls.stats['dns_cache_hits'] += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            cls.stats['dns_cache_misses'] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    @classmethod
+    async def start(cls):
+        """Open the shared session (call once the event loop is running)"""
+        if cls.session is not None and not cls.session.closed:
+            return cls.session
+
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            use_dns_cache=True,
+            enable_cleanup_closed=True
+        )
+        cls.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HTTP_HEADERS,
+            trace_configs=[cls._build_trace_config()]
+        )
+        return cls.session
+
+    @classmethod
+    async def close(cls):
+        """Close the shared session and release pooled connections"""
+        if cls.session is not None and not cls.session.closed:
+            await cls.session.close()
+        cls.session = None
+
+    @classmethod
+    async def get_session(cls) -> aiohttp.ClientSession:
+        """Return the shared session, opening it lazily if needed"""
+        if cls.session is None or cls.session.closed:
+            await cls.start()
+        return cls.session
+
+    @classmethod
+    def reuse_ratio(cls) -> float:
+        """Share of requests served over an already open connection"""
+        total = cls.stats['connections_created'] + cls.stats['connections_reused']
+        if not total:
+            return 0.0
+        return cls.stats['connections_reused'] / total
+
+    @classmethod
+    def record_timing(cls, endpoint: str, seconds: float):
+        """Record how long one call to an upstream endpoint took"""
+        cls.timings[endpoint].append(seconds)
+        upstream_seconds.observe(seconds, endpoint)
+
+    @classmethod
+    def record_status(cls, host: str, status):
+        """Count one upstream answer by status code ('error' if none arrived)"""
+        upstream_responses.inc(host, status)
+
+    @classmethod
+    def timing_summary(cls) -> dict:
+        """p50/p95/max latency in milliseconds per endpoint"""
+        summary = {}
+        for endpoint, samples in cls.timings.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            last = len(ordered) - 1
+            summary[endpoint] = {
+                'count': len(ordered),
+                'p50_ms': round(ordered[int(last * 0.50)] * 1000, 1),
+                'p95_ms': round(ordered[int(last * 0.95)] * 1000, 1),
+                'max_ms': round(ordered[-1] * 1000, 1),
+            }
+        return summary
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+# Outcomes of InFlightTracker.claim
+CLAIMED = 'claimed'
+DUPLICATE = 'duplicate'
+AT_CAPACITY = 'at_capacity'
+
+
+class InFlightTracker:
+    """Running analyses per user and per (user, address)
+
+    A second request for something the same user already has running is a
+    DUPLICATE; it should join the running analysis rather than start its
+    own. A user with `max_per_user` analyses running is AT_CAPACITY.
+    """
+
+    def __init__(self, max_per_user: int):
+        self.max_per_user = max_per_user
+        self.running = defaultdict(set)  # user_id -> keys being analyzed
+        self.stats = {'claimed': 0, 'deduplicated': 0, 'rejected': 0}
+
+    def claim(self, user_id: int, key: str) -> str:
+        keys = self.running[user_id]
+        if key in keys:
+            self.stats['deduplicated'] += 1
+            return DUPLICATE
+        if len(keys) >= self.max_per_user:
+            self.stats['rejected'] += 1
+            return AT_CAPACITY
+        keys.add(key)
+        self.stats['claimed'] += 1
+        return CLAIMED
+
+    def release(self, user_id: int, key: str):
+        keys = self.running.get(user_id)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self.running[user_id]
+
+    def is_running(self, user_id: int, key: str) -> bool:
+        return key in self.running.get(user_id, ())
+
+    def summary(self) -> dict:
+        return dict(self.stats, users=len(self.running), running=sum(len(keys) for keys in self.running.values()))
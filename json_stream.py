@@ -0,0 +1,85 @@
+import codecs
+import json
+
+# Bytes read from the response per step
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\r\n'
+
+
+class JsonArrayParser:
+    """Incremental parser for a top-level JSON array
+
+    Feed it text as it arrives and it returns each array element once that
+    element is complete, so only the unparsed tail of the body plus one
+    element is ever held in memory. Elements are decoded with the C JSON
+    scanner via `raw_decode`; an element split across chunks is simply
+    retried when more text arrives.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.started = False
+        self.finished = False
+
+    def feed(self, text: str) -> list:
+        if self.finished:
+            return []
+        buffer = self.buffer + text if self.buffer else text
+        items = []
+        pos = 0
+        end = len(buffer)
+
+        while pos < end:
+            char = buffer[pos]
+            if char in _WHITESPACE or (char == ',' and self.started):
+                pos += 1
+                continue
+            if not self.started:
+                if char != '[':
+                    raise ValueError(f"Expected a JSON array, got {char!r}")
+                self.started = True
+                pos += 1
+                continue
+            if char == ']':
+                self.finished = True
+                pos += 1
+                break
+            if char not in '{["':
+                # A bare number or literal may continue in the next chunk
+                terminator = _find_terminator(buffer, pos)
+                if terminator < 0:
+                    break
+            try:
+                item, pos = self.decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break
+            items.append(item)
+
+        self.buffer = buffer[pos:]
+        return items
+
+    def close(self):
+        """Verify that the whole array was received"""
+        if not self.finished:
+            raise ValueError("Truncated JSON array")
+
+
+def _find_terminator(buffer: str, pos: int) -> int:
+    for index in range(pos, len(buffer)):
+        if buffer[index] in ',]' or buffer[index] in _WHITESPACE:
+            return index
+    return -1
+
+
+async def iter_json_array(content, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yield the elements of a JSON array read incrementally from an aiohttp StreamReader"""
+    parser = JsonArrayParser()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    async for chunk in content.iter_chunked(chunk_size):
+        for item in parser.feed(decoder.decode(chunk)):
+            yield item
+    for item in parser.feed(decoder.decode(b'', final=True)):
+        yield item
+    parser.close()
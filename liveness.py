@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+
+from metrics import registry
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+loop_lag_seconds = registry.histogram(
+    'btcbot_event_loop_lag_seconds', 'How late the loop-lag sampler woke up', buckets=LAG_BUCKETS
+)
+
+
+def process_age() -> float:
+    """Seconds since the process started, from /proc (0 where it is not available)"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the parenthesised command name start at field 3; starttime is field 22
+            started_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        return max(time.clock_gettime(time.CLOCK_BOOTTIME) - started_ticks / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+# Monotonic time the process started, so interpreter start-up and imports count towards startup phases
+PROCESS_STARTED = time.monotonic() - process_age()
+
+
+class LivenessMonitor:
+    """Tracks whether the bot's event loop is actually making progress
+
+    A sampler task sleeps for `interval` and measures how late it wakes up;
+    that overshoot is the event-loop lag. Handlers call `record_update()`
+    for every processed Telegram update so /health can report its age.
+
+    `startup` records when each startup phase was reached, in seconds after
+    the process started; the first processed update is one of them.
+    """
+
+    def __init__(self, interval: float = 0.5, max_lag: float = 2.0):
+        self.interval = interval
+        self.max_lag = max_lag
+        self.started_at = time.monotonic()
+        self.last_update_at = None
+        self.last_beat_at = None
+        self.lag = 0.0
+        self.max_seen_lag = 0.0
+        self.task = None
+        self.stats = {'updates': 0}
+        self.startup = {}
+
+    def mark_startup(self, phase: str) -> float:
+        """Record the first time `phase` is reached; returns its offset from process start"""
+        if phase not in self.startup:
+            self.startup[phase] = round(time.monotonic() - PROCESS_STARTED, 3)
+        return self.startup[phase]
+
+    def record_update(self):
+        self.last_update_at = time.monotonic()
+        self.stats['updates'] += 1
+        if self.stats['updates'] == 1:
+            self.mark_startup('first_update')
+
+    def last_update_age(self):
+        if self.last_update_at is None:
+            return None
+        return time.monotonic() - self.last_update_at
+
+    def current_lag(self) -> float:
+        """Lag of the last sample, or the time since it if the sampler is overdue"""
+        if self.last_beat_at is None:
+            return 0.0
+        overdue = time.monotonic() - self.last_beat_at - self.interval
+        return max(self.lag, overdue, 0.0)
+
+    def is_healthy(self) -> bool:
+        return self.task is not None and not self.task.done() and self.current_lag() < self.max_lag
+
+    async def run(self):
+        self.last_beat_at = time.monotonic()
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(now - expected, 0.0)
+            loop_lag_seconds.observe(self.lag)
+            self.max_seen_lag = max(self.max_seen_lag, self.lag)
+            self.last_beat_at = now
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def summary(self) -> dict:
+        age = self.last_update_age()
+        return dict(
+            self.stats,
+            uptime=round(time.monotonic() - self.started_at, 1),
+            last_update_age=round(age, 1) if age is not None else None,
+            loop_lag_ms=round(self.current_lag() * 1000, 1),
+            max_loop_lag_ms=round(self.max_seen_lag * 1000, 1),
+            startup=self.startup
+        )
@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Priority lanes: lower value is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+LANE_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+# Lane of the code currently running; tasks inherit it from whoever created them
+current_lane = ContextVar('outbound_lane', default=INTERACTIVE)
+
+
+@contextmanager
+def background_lane():
+    """Mark outbound calls made inside the block (and tasks created there) as background"""
+    token = current_lane.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class SchedulerBusy(Exception):
+    """The outbound queue for a host is full and the request was shed"""
+
+    def __init__(self, host: str, depth: int):
+        super().__init__(f"outbound queue for {host} is full ({depth} waiting)")
+        self.host = host
+        self.depth = depth
+
+
+class HostBucket:
+    """Token bucket plus a priority queue of waiters for one upstream host"""
+
+    def __init__(self, host: str, rate: float, burst: float, max_queue: int, max_background_queue: int):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_background_queue = max_background_queue
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waiters = []  # heap of (lane, seq, future)
+        self.timer = None
+        self.stats = {'granted': 0, 'queued': 0, 'shed': 0}
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def depth(self, lane: int = None) -> int:
+        """Live waiters, optionally only those in `lane` or ahead of it"""
+        return sum(
+            1 for waiter_lane, _, future in self.waiters
+            if not future.done() and (lane is None or waiter_lane <= lane)
+        )
+
+
+class OutboundScheduler:
+    """Process-wide rate limiter for outbound HTTP calls, one token bucket per host
+
+    Callers `await acquire(host)` before each request. When no token is
+    available they queue, interactive lane ahead of background. A full queue
+    sheds new work with SchedulerBusy instead of letting it pile up; the
+    background lane is shed first.
+    """
+
+    def __init__(self, default_rate: float, default_burst: float, max_queue: int, max_background_queue: int):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.max_queue = max_queue
+        self.max_background_queue = max_background_queue
+        self.buckets = {}
+        self.sequence = itertools.count()
+
+    def configure_host(self, host: str, rate: float, burst: float):
+        self.buckets[host] = HostBucket(host, rate, burst, self.max_queue, self.max_background_queue)
+
+    def bucket(self, host: str) -> HostBucket:
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = HostBucket(
+                host, self.default_rate, self.default_burst, self.max_queue, self.max_background_queue
+            )
+        return bucket
+
+    def queue_position(self, host: str, lane: int = INTERACTIVE) -> int:
+        """Position a new request in `lane` would take (0 = sent immediately)"""
+        bucket = self.bucket(host)
+        bucket.refill()
+        ahead = bucket.depth(lane)
+        if ahead == 0 and bucket.tokens >= 1:
+            return 0
+        return ahead + 1
+
+    def is_saturated(self, host: str, lane: int = INTERACTIVE) -> bool:
+        bucket = self.bucket(host)
+        limit = bucket.max_queue if lane == INTERACTIVE else bucket.max_background_queue
+        return bucket.depth() >= limit
+
+    async def acquire(self, host: str, lane: int = None):
+        """Wait for a token for `host`; raises SchedulerBusy when the queue is full"""
+        lane = current_lane.get() if lane is None else lane
+        bucket = self.bucket(host)
+        bucket.refill()
+        if bucket.tokens >= 1 and not bucket.depth():
+            bucket.tokens -= 1
+            bucket.stats['granted'] += 1
+            return
+
+        depth = bucket.depth()
+        limit = bucket.max_queue if lane == INTERACTIVE else bucket.max_background_queue
+        if depth >= limit:
+            bucket.stats['shed'] += 1
+            raise SchedulerBusy(host, depth)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(bucket.waiters, (lane, next(self.sequence), future))
+        bucket.stats['queued'] += 1
+        self._schedule(bucket)
+        await future
+
+    def _schedule(self, bucket: HostBucket):
+        if bucket.timer is not None:
+            return
+        delay = max((1 - bucket.tokens) / bucket.rate, 0) if bucket.rate > 0 else 1.0
+        bucket.timer = asyncio.get_running_loop().call_later(delay, self._release, bucket)
+
+    def _release(self, bucket: HostBucket):
+        bucket.timer = None
+        bucket.refill()
+        while bucket.waiters and bucket.tokens >= 1:
+            _, _, future = heapq.heappop(bucket.waiters)
+            if future.done():
+                # The waiter was cancelled while queued
+                continue
+            bucket.tokens -= 1
+            bucket.stats['granted'] += 1
+            future.set_result(None)
+        while bucket.waiters and bucket.waiters[0][2].done():
+            heapq.heappop(bucket.waiters)
+        if bucket.waiters:
+            self._schedule(bucket)
+
+    def summary(self) -> dict:
+        return {
+            host: dict(
+                bucket.stats,
+                rate=bucket.rate,
+                tokens=round(bucket.tokens, 2),
+                waiting=bucket.depth(),
+                waiting_background=bucket.depth() - bucket.depth(INTERACTIVE)
+            )
+            for host, bucket in self.buckets.items()
+        }
+
+
+# Shared by every outbound caller in the process; bot.py configures per-host rates
+outbound = OutboundScheduler(default_rate=10, default_burst=20, max_queue=200, max_background_queue=50)
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from typing import NamedTuple
+
+
+class PriceQuote(NamedTuple):
+    """A BTC/USD price and the wall-clock time it was fetched"""
+    price: float
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        return max(time.time() - self.fetched_at, 0.0)
+
+
+class StaleWhileRevalidateCache:
+    """Process-wide cache of one upstream value with stale-while-revalidate
+
+    An entry younger than `ttl` is served as-is. An older entry is still
+    served while it is younger than `stale_ttl`, and a refresh is started in
+    the background. Concurrent misses share a single upstream request.
+
+    Subclasses set `entry_type`, a NamedTuple with a `fetched_at` field, and
+    turn what `fetcher()` returns into one in `make_entry` (None when the
+    answer is unusable). With a `shared` StateBackend and a `shared_key`, a
+    refresh first adopts a fresh entry that another process stored there,
+    and every upstream entry is stored back.
+    """
+    entry_type = None
+    label = 'value'
+    shared_key = None
+
+    def __init__(self, fetcher, ttl: float, stale_ttl: float):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.entry = None
+        self.inflight = None
+        self.refresher = None
+        self.shared = None
+        self.stats = {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'shared_hits': 0, 'upstream_calls': 0, 'upstream_errors': 0
+        }
+
+    def make_entry(self, data, fetched_at: float):
+        raise NotImplementedError
+
+    async def get(self):
+        """Return the best available entry, or None if nothing was ever fetched"""
+        entry = self.entry
+        if entry is not None:
+            age = time.time() - entry.fetched_at
+            if age < self.ttl:
+                self.stats['hits'] += 1
+                return entry
+            if age < self.stale_ttl:
+                self.stats['stale_hits'] += 1
+                self._revalidate()
+                return entry
+
+        self.stats['misses'] += 1
+        fresh = await self._revalidate()
+        # Last known good entry, however old, beats nothing at all
+        return fresh if fresh is not None else self.entry
+
+    def _revalidate(self) -> asyncio.Future:
+        """Start a refresh unless one is already in flight (single-flight)"""
+        if self.inflight is None or self.inflight.done():
+            self.inflight = asyncio.ensure_future(self._fetch())
+        return asyncio.shield(self.inflight)
+
+    async def _fetch(self):
+        if self.shared is not None and self.shared_key is not None:
+            try:
+                stored = await self.shared.load_value(self.shared_key)
+            except Exception as e:
+                print(f"Error reading shared {self.label}: {e}")
+                stored = None
+            if stored and time.time() - stored['fetched_at'] < self.ttl:
+                self.stats['shared_hits'] += 1
+                self.adopt(self.entry_type(**stored))
+                return self.entry
+        self.stats['upstream_calls'] += 1
+        try:
+            data = await self.fetcher()
+        except Exception as e:
+            print(f"Error fetching {self.label}: {e}")
+            data = None
+
+        entry = self.make_entry(data, time.time()) if data is not None else None
+        if entry is None:
+            self.stats['upstream_errors'] += 1
+            return None
+
+        self.entry = entry
+        if self.shared is not None and self.shared_key is not None:
+            self.shared.save_value(self.shared_key, entry._asdict())
+        return entry
+
+    def adopt(self, entry):
+        """Take `entry` unless the cache already holds a newer one"""
+        if self.entry is None or self.entry.fetched_at < entry.fetched_at:
+            self.entry = entry
+
+    async def _refresh_forever(self, interval: float):
+        while True:
+            await self._revalidate()
+            await asyncio.sleep(interval)
+
+    def start_refresher(self, interval: float):
+        """Keep the entry warm from a background task"""
+        if self.refresher is None or self.refresher.done():
+            self.refresher = asyncio.create_task(self._refresh_forever(interval))
+
+    async def stop_refresher(self):
+        if self.refresher is not None:
+            self.refresher.cancel()
+            try:
+                await self.refresher
+            except asyncio.CancelledError:
+                pass
+            self.refresher = None
+
+
+class PriceCache(StaleWhileRevalidateCache):
+    """Process-wide BTC price cache; entries are PriceQuotes
+
+    The fetcher returns the price as a number (None on failure). Processes
+    sharing a StateBackend share the quote under 'btc_price'.
+    """
+    entry_type = PriceQuote
+    label = 'BTC price'
+    shared_key = 'btc_price'
+
+    @property
+    def quote(self):
+        return self.entry
+
+    def make_entry(self, price, fetched_at: float):
+        return PriceQuote(float(price), fetched_at)
+
+    def restore(self, price: float, fetched_at: float):
+        """Seed the cache with a previously persisted quote"""
+        self.adopt(PriceQuote(float(price), fetched_at))
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_right
+
+DAY = 86400
+
+# File layout: header, then `count` day numbers (int32) and `count` prices (float64), native byte order
+HEADER = struct.Struct('=8sqqq')
+MAGIC = b'BTCUSD1\0'
+
+
+class PriceHistory:
+    """Daily BTC/USD prices, held as two array columns and persisted to one file
+
+    `days` holds UTC day numbers (unix time // 86400) in ascending order and
+    `prices` the first price CoinGecko reports for each day. Everything from
+    `covered_from` to `covered_to` (day numbers, inclusive) has been
+    fetched, so a lookup inside that span never goes to the network; a day
+    CoinGecko has no point for takes the closest earlier price.
+
+    Missing days are fetched in bulk: `fetch_range(start, end)` gets unix
+    seconds and must return CoinGecko's `[[ms, price], ...]` list, or None.
+    Only whole days before today are stored. Today, and anything older
+    than `max_days`, is answered with None.
+    """
+
+    def __init__(self, fetch_range, path: str, max_days: int, retry_after: float = 300):
+        self.fetch_range = fetch_range
+        self.path = path
+        self.max_days = max_days
+        self.retry_after = retry_after
+        self.days = array('i')
+        self.prices = array('d')
+        self.covered_from = None
+        self.covered_to = None
+        self.loaded_mtime = None
+        self.failed_at = 0.0
+        self.lock = asyncio.Lock()
+        self.stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'upstream_calls': 0, 'upstream_errors': 0}
+
+    def __len__(self):
+        return len(self.days)
+
+    def _read(self):
+        with open(self.path, 'rb') as f:
+            magic, covered_from, covered_to, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a price history file")
+            days = array('i')
+            prices = array('d')
+            days.fromfile(f, count)
+            prices.fromfile(f, count)
+        return covered_from, covered_to, days, prices, os.path.getmtime(self.path)
+
+    def _write(self, covered_from: int, covered_to: int, days: array, prices: array):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp{os.getpid()}"
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, covered_from, covered_to, len(days)))
+            days.tofile(f)
+            prices.tofile(f)
+        os.replace(temporary, self.path)
+        return os.path.getmtime(self.path)
+
+    async def load(self):
+        """Read the series from disk if it changed there (another process may have extended it)"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self.loaded_mtime:
+            return
+        try:
+            self.covered_from, self.covered_to, self.days, self.prices, self.loaded_mtime = (
+                await asyncio.to_thread(self._read)
+            )
+        except (OSError, ValueError, EOFError) as e:
+            print(f"Error reading price history {self.path}: {e}")
+
+    def _covered(self, day: int) -> bool:
+        return self.covered_from is not None and self.covered_from <= day <= self.covered_to
+
+    def lookup(self, timestamps: list) -> list:
+        """USD price at each unix timestamp from the local series (None where it has no answer)"""
+        days = self.days
+        prices = self.prices
+        result = []
+        for timestamp in timestamps:
+            day = int(timestamp // DAY) if timestamp else None
+            if day is None or not self._covered(day):
+                result.append(None)
+                continue
+            index = bisect_right(days, day) - 1
+            result.append(prices[index] if index >= 0 else None)
+        return result
+
+    def _wanted_days(self, timestamps: list, today: int) -> list:
+        oldest = today - self.max_days
+        return [
+            day for day in (int(timestamp // DAY) for timestamp in timestamps if timestamp)
+            if oldest <= day < today and not self._covered(day)
+        ]
+
+    async def prices_at(self, timestamps: list) -> list:
+        """USD price at each unix timestamp; fetches the days the local series lacks in one request"""
+        self.stats['lookups'] += 1
+        today = int(time.time() // DAY)
+        if self._wanted_days(timestamps, today):
+            async with self.lock:
+                await self.load()
+                wanted = self._wanted_days(timestamps, today)
+                if wanted and time.time() - self.failed_at >= self.retry_after:
+                    self.stats['misses'] += 1
+                    await self._extend(min(wanted), max(wanted), today)
+        else:
+            self.stats['hits'] += 1
+        return self.lookup(timestamps)
+
+    async def warm(self, days: int):
+        """Make sure the last `days` whole days are stored"""
+        today = int(time.time() // DAY)
+        await self.prices_at([(today - min(days, self.max_days)) * DAY, (today - 1) * DAY])
+
+    async def _extend(self, first: int, last: int, today: int):
+        """Fetch the days from `first` to `last`, widened so that coverage stays one contiguous span"""
+        if self.covered_from is not None:
+            first = min(first, self.covered_to + 1)
+            last = max(last, self.covered_from - 1)
+        self.stats['upstream_calls'] += 1
+        try:
+            points = await self.fetch_range(first * DAY, (last + 1) * DAY)
+        except Exception as e:
+            print(f"Error fetching price history: {e}")
+            points = None
+        if not points:
+            self.stats['upstream_errors'] += 1
+            self.failed_at = time.time()
+            return
+
+        # First point of each day; CoinGecko answers short ranges hourly or finer
+        merged = dict(zip(self.days, self.prices))
+        for millis, price in sorted(points):
+            day = int(millis // 1000 // DAY)
+            if first <= day <= last and day < today and day not in merged:
+                merged[day] = float(price)
+        ordered = sorted(merged)
+        days = array('i', ordered)
+        prices = array('d', (merged[day] for day in ordered))
+        covered_from = first if self.covered_from is None else min(first, self.covered_from)
+        covered_to = min(last, today - 1) if self.covered_to is None else max(min(last, today - 1), self.covered_to)
+        try:
+            self.loaded_mtime = await asyncio.to_thread(self._write, covered_from, covered_to, days, prices)
+        except OSError as e:
+            print(f"Error writing price history {self.path}: {e}")
+        self.days, self.prices = days, prices
+        self.covered_from, self.covered_to = covered_from, covered_to
+
+    def summary(self) -> dict:
+        return dict(self.stats, days=len(self.days), covered_from=self.covered_from, covered_to=self.covered_to)
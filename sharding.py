@@ -0,0 +1,166 @@
+import asyncio
+import signal
+
+import aiohttp
+from aiohttp import web
+
+# Per-forward timeout; workers only enqueue the update, so this is generous
+FORWARD_TIMEOUT = 10
+WORKER_HEALTH_TIMEOUT = 2
+WORKER_RESTART_DELAY = 1.0
+
+
+def update_user_id(update: dict):
+    """Id of the user an update belongs to (None if it has no sender or chat)"""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get('from') or value.get('user')
+        if isinstance(sender, dict) and 'id' in sender:
+            return sender['id']
+        chat = value.get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return None
+
+
+def shard_for(user_id, shard_count: int) -> int:
+    return (user_id or 0) % shard_count
+
+
+class ShardRouter:
+    """Webhook receiver that forwards each update to the worker owning its user
+
+    Every update of a user lands on the same worker, so that worker's rate
+    limiter and in-flight tracking see all of the user's requests. A worker
+    that cannot be reached turns into a 502, which makes Telegram redeliver
+    the update later.
+    """
+
+    def __init__(self, worker_urls: list, secret: str):
+        self.worker_urls = worker_urls
+        self.secret = secret
+        self.session = None
+        self.inflight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.draining = False
+        self.stats = {'forwarded': 0, 'failed': 0, 'rejected': 0}
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=FORWARD_TIMEOUT))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def handle(self, request):
+        if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != self.secret:
+            return web.Response(status=403)
+        if self.draining:
+            # Telegram keeps the update and retries, by then against the next instance
+            self.stats['rejected'] += 1
+            return web.Response(status=503)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        url = self.worker_urls[shard_for(update_user_id(update), len(self.worker_urls))]
+        self.inflight += 1
+        self.idle.clear()
+        try:
+            async with self.session.post(
+                url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': self.secret}
+            ) as response:
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error forwarding update to {url}: {e}")
+            status = 502
+        finally:
+            self.inflight -= 1
+            if not self.inflight:
+                self.idle.set()
+
+        if status != 200:
+            self.stats['failed'] += 1
+            return web.Response(status=502)
+        self.stats['forwarded'] += 1
+        return web.Response()
+
+    async def drain(self, timeout: float):
+        """Refuse new updates and wait for forwards already under way"""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Drain timed out with {self.inflight} updates still being forwarded")
+
+    async def worker_health(self, health_urls: list) -> list:
+        async def probe(url):
+            try:
+                async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=WORKER_HEALTH_TIMEOUT)) as response:
+                    return {'url': url, 'status': response.status}
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return {'url': url, 'status': None}
+        return await asyncio.gather(*[probe(url) for url in health_urls])
+
+    def summary(self) -> dict:
+        return dict(self.stats, inflight=self.inflight, draining=self.draining, workers=len(self.worker_urls))
+
+
+class WorkerSupervisor:
+    """Runs the worker processes and restarts any that exit unexpectedly
+
+    `command` is the argv of a worker and `env_for(index)` its environment.
+    """
+
+    def __init__(self, count: int, command: list, env_for):
+        self.count = count
+        self.command = command
+        self.env_for = env_for
+        self.processes = [None] * count
+        self.watchers = []
+        self.stopping = False
+        self.stats = {'started': 0, 'restarted': 0}
+
+    async def _spawn(self, index: int):
+        self.processes[index] = await asyncio.create_subprocess_exec(*self.command, env=self.env_for(index))
+        self.stats['started'] += 1
+
+    async def _watch(self, index: int):
+        while True:
+            returncode = await self.processes[index].wait()
+            if self.stopping:
+                return
+            print(f"Worker {index} exited with {returncode}, restarting")
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+            await self._spawn(index)
+            self.stats['restarted'] += 1
+
+    async def start(self):
+        for index in range(self.count):
+            await self._spawn(index)
+        self.watchers = [asyncio.create_task(self._watch(index)) for index in range(self.count)]
+
+    async def stop(self, timeout: float):
+        """SIGTERM every worker so it drains its queue and saves state; kill stragglers"""
+        self.stopping = True
+        for process in self.processes:
+            if process is not None and process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+        waits = [process.wait() for process in self.processes if process is not None]
+        done, pending = await asyncio.wait([asyncio.ensure_future(wait) for wait in waits], timeout=timeout)
+        if pending:
+            print(f"{len(pending)} workers did not stop in {timeout}s, killing them")
+            for process in self.processes:
+                if process is not None and process.returncode is None:
+                    process.kill()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for watcher in self.watchers:
+            watcher.cancel()
+        await asyncio.gather(*self.watchers, return_exceptions=True)
+
+    def summary(self) -> dict:
+        return dict(self.stats, running=sum(1 for process in self.processes if process and process.returncode is None))
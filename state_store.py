@@ -0,0 +1,277 @@
+import asyncio
+import json
+import os
+import time
+
+# Rate-limit events older than this are never needed again
+RATE_EVENT_RETENTION = 86400
+
+
+class StateBackend:
+    """Interface for persisting rate-limit events and cache snapshots
+
+    Writes are buffered in memory by the caller's thread and persisted by
+    `flush()`, so recording state never blocks the event loop.
+    """
+
+    async def open(self):
+        pass
+
+    def record_rate_event(self, user_id: int, timestamp: float):
+        raise NotImplementedError
+
+    async def load_rate_events(self, since: float) -> list:
+        """Return (user_id, timestamp) pairs newer than `since`, oldest first"""
+        raise NotImplementedError
+
+    def save_value(self, key: str, value):
+        raise NotImplementedError
+
+    async def load_value(self, key: str):
+        raise NotImplementedError
+
+    def record_watch(self, chat_id: int, address: str, active: bool):
+        """Add (active) or remove a watch subscription"""
+        raise NotImplementedError
+
+    async def load_watches(self) -> list:
+        """Return every (chat_id, address) subscription"""
+        raise NotImplementedError
+
+    def store_cached(self, key: str, value, expires_at: float):
+        """Offer a cache entry to other processes; a no-op unless the backend is shared"""
+
+    async def load_cached(self, key: str):
+        """Return (value, expires_at) stored by any process, or None"""
+        return None
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        await self.flush()
+
+
+class MemoryBackend(StateBackend):
+    """Keeps state in process memory only (the default, and what tests use)"""
+
+    def __init__(self):
+        self.rate_events = []
+        self.values = {}
+        self.watches = set()
+
+    def record_rate_event(self, user_id: int, timestamp: float):
+        self.rate_events.append((user_id, timestamp))
+
+    async def load_rate_events(self, since: float) -> list:
+        return [event for event in self.rate_events if event[1] > since]
+
+    def save_value(self, key: str, value):
+        self.values[key] = value
+
+    async def load_value(self, key: str):
+        return self.values.get(key)
+
+    def record_watch(self, chat_id: int, address: str, active: bool):
+        if active:
+            self.watches.add((chat_id, address))
+        else:
+            self.watches.discard((chat_id, address))
+
+    async def load_watches(self) -> list:
+        return sorted(self.watches)
+
+
+class SQLiteBackend(StateBackend):
+    """SQLite (WAL mode) store on the persistent disk
+
+    All database work runs in a worker thread; writes are batched and
+    flushed every `flush_interval` seconds and on shutdown. Several
+    processes may open the same file; the `shared_cache` table is how
+    sharded workers share address lookups.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.conn = None
+        self.pending_events = []
+        self.pending_values = {}
+        self.pending_watches = []
+        self.pending_cache = {}
+        self.lock = asyncio.Lock()
+        self.flusher = None
+        self.stats = {'flushes': 0, 'events_written': 0, 'values_written': 0, 'compactions': 0}
+        self.last_compaction = 0.0
+
+    def _connect(self):
+        import sqlite3  # only this backend needs it
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_events (user_id INTEGER NOT NULL, ts REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS rate_events_ts ON rate_events (ts)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS watches (chat_id INTEGER NOT NULL, address TEXT NOT NULL, "
+            "PRIMARY KEY (chat_id, address))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_cache (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    async def open(self):
+        if self.conn is None:
+            self.conn = await asyncio.to_thread(self._connect)
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self._flush_forever())
+
+    def record_rate_event(self, user_id: int, timestamp: float):
+        self.pending_events.append((user_id, timestamp))
+
+    def save_value(self, key: str, value):
+        self.pending_values[key] = value
+
+    def record_watch(self, chat_id: int, address: str, active: bool):
+        self.pending_watches.append((chat_id, address, active))
+
+    def store_cached(self, key: str, value, expires_at: float):
+        self.pending_cache[key] = (value, expires_at)
+
+    async def load_rate_events(self, since: float) -> list:
+        await self.flush()
+        async with self.lock:
+            return await asyncio.to_thread(self._select_rate_events, since)
+
+    def _select_rate_events(self, since: float) -> list:
+        return self.conn.execute(
+            "SELECT user_id, ts FROM rate_events WHERE ts > ? ORDER BY ts", (since,)
+        ).fetchall()
+
+    async def load_value(self, key: str):
+        if key in self.pending_values:
+            return self.pending_values[key]
+        def read():
+            row = self.conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            # Decoded in the worker thread too: cache snapshots can be megabytes
+            return json.loads(row[0]) if row else None
+        async with self.lock:
+            return await asyncio.to_thread(read)
+
+    async def load_watches(self) -> list:
+        await self.flush()
+        async with self.lock:
+            return await asyncio.to_thread(
+                lambda: self.conn.execute("SELECT chat_id, address FROM watches ORDER BY chat_id").fetchall()
+            )
+
+    async def load_cached(self, key: str):
+        if key in self.pending_cache:
+            value, expires_at = self.pending_cache[key]
+        else:
+            async with self.lock:
+                row = await asyncio.to_thread(
+                    lambda: self.conn.execute(
+                        "SELECT value, expires_at FROM shared_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                )
+            if row is None:
+                return None
+            value, expires_at = json.loads(row[0]), row[1]
+        if expires_at <= time.time():
+            return None
+        return value, expires_at
+
+    def _write_batch(self, events: list, values: dict, watches: list, cache: dict, compact: bool):
+        with self.conn:
+            if events:
+                self.conn.executemany("INSERT INTO rate_events (user_id, ts) VALUES (?, ?)", events)
+            now = time.time()
+            for key, value in values.items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, updated) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, separators=(',', ':'), default=list), now)
+                )
+            for chat_id, address, active in watches:
+                if active:
+                    self.conn.execute("INSERT OR IGNORE INTO watches (chat_id, address) VALUES (?, ?)", (chat_id, address))
+                else:
+                    self.conn.execute("DELETE FROM watches WHERE chat_id = ? AND address = ?", (chat_id, address))
+            for key, (value, expires_at) in cache.items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO shared_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                    (key, expires_at, json.dumps(value, separators=(',', ':'), default=list))
+                )
+            if compact:
+                self.conn.execute("DELETE FROM rate_events WHERE ts <= ?", (now - RATE_EVENT_RETENTION,))
+                self.conn.execute("DELETE FROM shared_cache WHERE expires_at <= ?", (now,))
+        if compact:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    async def flush(self):
+        """Persist buffered writes from a worker thread"""
+        if self.conn is None:
+            return
+        async with self.lock:
+            pending = self.pending_events or self.pending_values or self.pending_watches or self.pending_cache
+            if not pending and time.time() - self.last_compaction < 3600:
+                return
+            events, self.pending_events = self.pending_events, []
+            values, self.pending_values = self.pending_values, {}
+            watches, self.pending_watches = self.pending_watches, []
+            cache, self.pending_cache = self.pending_cache, {}
+            compact = time.time() - self.last_compaction >= 3600
+            try:
+                await asyncio.to_thread(self._write_batch, events, values, watches, cache, compact)
+            except Exception as e:
+                print(f"Error flushing state: {e}")
+                # Keep the batch for the next attempt
+                self.pending_events[:0] = events
+                self.pending_watches[:0] = watches
+                for key, value in values.items():
+                    self.pending_values.setdefault(key, value)
+                for key, entry in cache.items():
+                    self.pending_cache.setdefault(key, entry)
+                return
+            self.stats['flushes'] += 1
+            self.stats['events_written'] += len(events)
+            self.stats['values_written'] += len(values)
+            if compact:
+                self.last_compaction = time.time()
+                self.stats['compactions'] += 1
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+            self.flusher = None
+        await self.flush()
+        if self.conn is not None:
+            await asyncio.to_thread(self.conn.close)
+            self.conn = None
+
+
+def create_backend(kind: str, data_dir: str) -> StateBackend:
+    """Build the backend named by STATE_BACKEND ('memory' or 'sqlite')"""
+    if kind == 'sqlite':
+        return SQLiteBackend(os.path.join(data_dir, 'bot_state.sqlite3'))
+    if kind != 'memory':
+        print(f"Unknown state backend {kind!r}, using memory")
+    return MemoryBackend()
@@ -0,0 +1,152 @@
+from array import array
+
+# NumPy is optional (the array-based path is used without it) and imported on
+# first use, as it is the slowest import of the bot and only analyses need it
+_numpy = None
+_numpy_checked = False
+
+
+def load_numpy():
+    """The numpy module, or None if it is not installed"""
+    global _numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            pass
+        _numpy_checked = True
+    return _numpy
+
+
+def bucket_sums(keys, values, size: int):
+    """int64 totals of the numpy array `values` in `size` buckets by `keys` (needs numpy)"""
+    numpy = load_numpy()
+    # float64 weights are exact for any satoshi amount (< 2**53)
+    return numpy.bincount(keys, weights=values, minlength=size).astype(numpy.int64)
+
+
+def _output_addresses(entry) -> list:
+    """Esplora gives one address as a string; tolerate lists and missing values"""
+    addr = entry.get('scriptpubkey_address')
+    if isinstance(addr, str):
+        return [addr]
+    if isinstance(addr, list):
+        return addr
+    return []
+
+
+class TxBatch:
+    """A batch of transactions flattened into columnar arrays
+
+    Every (output, address) pair becomes one row of `out_tx`/`out_addr`/
+    `out_value`, every (spent prevout, address) pair one row of the `in_*`
+    columns. Addresses are interned to small integer ids so that flows can
+    be summed per transaction or per address without touching the original
+    dicts again.
+    """
+
+    def __init__(self):
+        self.txids = []
+        self.address_ids = {}
+        self.addresses = []
+        self.out_tx = array('l')
+        self.out_addr = array('l')
+        self.out_value = array('q')
+        self.in_tx = array('l')
+        self.in_addr = array('l')
+        self.in_value = array('q')
+
+    def _intern(self, address: str) -> int:
+        address_id = self.address_ids.get(address)
+        if address_id is None:
+            address_id = self.address_ids[address] = len(self.addresses)
+            self.addresses.append(address)
+        return address_id
+
+    @classmethod
+    def from_transactions(cls, transactions: list):
+        batch = cls()
+        intern = batch._intern
+        for tx_index, tx in enumerate(transactions):
+            batch.txids.append(tx['txid'])
+            for vout in tx.get('vout', []):
+                for addr in _output_addresses(vout):
+                    batch.out_tx.append(tx_index)
+                    batch.out_addr.append(intern(addr))
+                    batch.out_value.append(vout.get('value', 0))
+            for vin in tx.get('vin', []):
+                prevout = vin.get('prevout')
+                if not prevout:
+                    continue
+                for addr in _output_addresses(prevout):
+                    batch.in_tx.append(tx_index)
+                    batch.in_addr.append(intern(addr))
+                    batch.in_value.append(prevout.get('value', 0))
+        return batch
+
+    def __len__(self):
+        return len(self.txids)
+
+    @staticmethod
+    def _sum_by(keys: array, values: array, size: int, mask_key: array = None, mask_id: int = None) -> array:
+        """Sum `values` into `size` buckets by `keys`, optionally only rows where mask_key == mask_id"""
+        numpy = load_numpy()
+        if numpy is not None and len(keys):
+            np_keys = numpy.frombuffer(keys, dtype=numpy.int64 if keys.itemsize == 8 else numpy.int32)
+            np_values = numpy.frombuffer(values, dtype=numpy.int64)
+            if mask_key is not None:
+                np_mask = numpy.frombuffer(mask_key, dtype=np_keys.dtype) == mask_id
+                np_keys = np_keys[np_mask]
+                np_values = np_values[np_mask]
+            return array('q', bucket_sums(np_keys, np_values, size).tobytes())
+
+        totals = array('q', bytes(8 * size))
+        if mask_key is None:
+            for key, value in zip(keys, values):
+                totals[key] += value
+        else:
+            for key, match, value in zip(keys, mask_key, values):
+                if match == mask_id:
+                    totals[key] += value
+        return totals
+
+    def flows_for(self, address: str) -> list:
+        """(received, sent, net) satoshis of `address` for every transaction"""
+        size = len(self.txids)
+        address_id = self.address_ids.get(address)
+        if address_id is None:
+            return [(0, 0, 0)] * size
+        received = self._sum_by(self.out_tx, self.out_value, size, self.out_addr, address_id)
+        sent = self._sum_by(self.in_tx, self.in_value, size, self.in_addr, address_id)
+        return [(r, s, r - s) for r, s in zip(received, sent)]
+
+    def flows_by_address(self) -> dict:
+        """address -> (received, sent, net) satoshis across the whole batch"""
+        size = len(self.addresses)
+        received = self._sum_by(self.out_addr, self.out_value, size)
+        sent = self._sum_by(self.in_addr, self.in_value, size)
+        return {
+            address: (r, s, r - s)
+            for address, r, s in zip(self.addresses, received, sent)
+        }
+
+
+def net_flows(transactions: list, address: str) -> list:
+    """(received, sent, net) satoshis of `address` for each transaction"""
+    # One pass over the dicts: flattening into a TxBatch only pays off when the batch is reused
+    flows = []
+    for tx in transactions:
+        received = sent = 0
+        for vout in tx.get('vout', ()):
+            addr = vout.get('scriptpubkey_address')
+            if addr == address or (isinstance(addr, list) and address in addr):
+                received += vout.get('value', 0)
+        for vin in tx.get('vin', ()):
+            prevout = vin.get('prevout')
+            if prevout:
+                addr = prevout.get('scriptpubkey_address')
+                if addr == address or (isinstance(addr, list) and address in addr):
+                    sent += prevout.get('value', 0)
+        flows.append((received, sent, received - sent))
+    return flows
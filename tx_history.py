@@ -0,0 +1,238 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+# Esplora returns confirmed history in pages of 25, newest first
+CHAIN_PAGE_SIZE = 25
+
+
+class HistoryCursor:
+    """How far the confirmed history of one address has been walked"""
+    __slots__ = ('newest_txid', 'newest_time', 'oldest_txid', 'oldest_time', 'tx_seen', 'complete')
+
+    def __init__(self):
+        self.newest_txid = None
+        self.newest_time = None
+        self.oldest_txid = None
+        self.oldest_time = None
+        self.tx_seen = 0
+        self.complete = False
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def summary(self) -> dict:
+        return {'first_tx_time': self.oldest_time, 'complete': self.complete, 'tx_seen': self.tx_seen}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        cursor = cls()
+        for name in cls.__slots__:
+            setattr(cursor, name, data.get(name, getattr(cursor, name)))
+        return cursor
+
+
+class TxHistoryFetcher:
+    """Incremental, budgeted walker over an address's confirmed history
+
+    Pages come from `/address/{a}/txs/chain/{last_seen_txid}`. A cursor per
+    address remembers the newest and oldest transaction already seen, so a
+    later refresh only fetches what is newer than the last visit and then
+    resumes the backward walk where the previous budget ran out.
+
+    `fetch_raw(endpoint, path)` must return the response body as bytes, or
+    None for a non-200 answer.
+
+    Callers that cannot wait for a full walk refresh with a small
+    `max_pages` and hand the rest to `continue_walk`, which runs the full
+    budget in a background task, one address at a time.
+    """
+
+    def __init__(self, fetch_raw, max_pages: int, max_bytes: int, concurrency: int, max_cursors: int = 10000,
+                 max_pending_walks: int = 100):
+        self.fetch_raw = fetch_raw
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_cursors = max_cursors
+        self.cursors = OrderedDict()
+        self.max_pending_walks = max_pending_walks
+        self.walks = {}
+        self.walk_slot = asyncio.Semaphore(1)
+        self.stats = {'pages': 0, 'bytes': 0, 'budget_exhausted': 0, 'walks': 0, 'walks_dropped': 0}
+
+    def get_cursor(self, address: str):
+        cursor = self.cursors.get(address)
+        if cursor is not None:
+            self.cursors.move_to_end(address)
+        return cursor
+
+    def _store_cursor(self, address: str, cursor: HistoryCursor):
+        self.cursors[address] = cursor
+        self.cursors.move_to_end(address)
+        while len(self.cursors) > self.max_cursors:
+            self.cursors.popitem(last=False)
+
+    async def iter_pages(self, address: str, after_txid: str = None, budget: dict = None):
+        """Yield pages of confirmed transactions, newest first, older than `after_txid`
+
+        Stops at the end of the history or when `budget` (a dict with
+        'pages', 'bytes' and optional 'deadline' keys, decremented in
+        place) runs out; budget['exhausted'] tells the two apart.
+        """
+        budget = budget if budget is not None else {'pages': self.max_pages, 'bytes': self.max_bytes}
+        budget['exhausted'] = False
+        while True:
+            deadline = budget.get('deadline')
+            if budget['pages'] <= 0 or budget['bytes'] <= 0 or (deadline and time.monotonic() >= deadline):
+                budget['exhausted'] = True
+                self.stats['budget_exhausted'] += 1
+                return
+
+            path = f"/address/{address}/txs/chain"
+            if after_txid:
+                path += f"/{after_txid}"
+
+            try:
+                async with self.semaphore:
+                    timeout = max(deadline - time.monotonic(), 0.001) if deadline else None
+                    body = await asyncio.wait_for(self.fetch_raw('txs_chain', path), timeout=timeout)
+            except Exception as e:
+                print(f"Error fetching history page of {address}: {e!r}")
+                body = None
+            if body is None:
+                budget['exhausted'] = True
+                return
+
+            page = json.loads(body)
+            budget['pages'] -= 1
+            budget['bytes'] -= len(body)
+            self.stats['pages'] += 1
+            self.stats['bytes'] += len(body)
+
+            if page:
+                yield page
+            if len(page) < CHAIN_PAGE_SIZE:
+                return
+            after_txid = page[-1]['txid']
+
+    @staticmethod
+    def _absorb(cursor: HistoryCursor, tx: dict):
+        """Account for the next (older) transaction of a newest-first walk"""
+        block_time = tx.get('status', {}).get('block_time')
+        if cursor.newest_txid is None:
+            cursor.newest_txid = tx['txid']
+            cursor.newest_time = block_time
+        cursor.oldest_txid = tx['txid']
+        cursor.oldest_time = block_time
+        cursor.tx_seen += 1
+
+    async def _newest_pages(self, address: str, first_page: list, budget: dict):
+        if first_page is not None:
+            confirmed = [tx for tx in first_page if tx.get('status', {}).get('confirmed')]
+            if confirmed:
+                yield confirmed
+            if len(confirmed) < CHAIN_PAGE_SIZE:
+                return
+            pages = self.iter_pages(address, confirmed[-1]['txid'], budget)
+        else:
+            pages = self.iter_pages(address, None, budget)
+        try:
+            async for page in pages:
+                yield page
+        finally:
+            await pages.aclose()
+
+    async def refresh(self, address: str, first_page: list = None, deadline: float = None,
+                      max_pages: int = None) -> HistoryCursor:
+        """Bring the address cursor up to date within the page/byte budget
+
+        `first_page` may be the `/address/{a}/txs` response the caller
+        already has; its confirmed part is the newest chain page, which
+        saves one request and does not count against the budget.
+        `max_pages` lowers the page budget for this call.
+        """
+        cursor = self.get_cursor(address)
+        pages_budget = self.max_pages if max_pages is None else min(max_pages, self.max_pages)
+        budget = {'pages': pages_budget, 'bytes': self.max_bytes, 'deadline': deadline}
+
+        # Walk back from the tip until we meet the newest transaction already known
+        walk = HistoryCursor()
+        reached_known = False
+        pages = self._newest_pages(address, first_page, budget)
+        try:
+            async for page in pages:
+                for tx in page:
+                    if cursor is not None and tx['txid'] == cursor.newest_txid:
+                        reached_known = True
+                        break
+                    self._absorb(walk, tx)
+                if reached_known:
+                    break
+        finally:
+            await pages.aclose()
+
+        if reached_known:
+            if walk.newest_txid is not None:
+                cursor.newest_txid = walk.newest_txid
+                cursor.newest_time = walk.newest_time
+                cursor.tx_seen += walk.tx_seen
+        else:
+            # First visit, or the known tip vanished (reorg) or lies beyond the budget
+            cursor = walk
+            cursor.complete = not budget.get('exhausted', False)
+
+        # Resume the backward walk where the previous budget ran out
+        if not cursor.complete and cursor.oldest_txid is not None:
+            pages = self.iter_pages(address, cursor.oldest_txid, budget)
+            try:
+                async for page in pages:
+                    for tx in page:
+                        self._absorb(cursor, tx)
+            finally:
+                await pages.aclose()
+            cursor.complete = not budget['exhausted']
+
+        self._store_cursor(address, cursor)
+        return cursor
+
+    def continue_walk(self, address: str):
+        """Walk the rest of the history in the background with the full budget
+
+        At most one walk per address is queued, and walks run one at a
+        time so they never take more than one of the page fetch slots.
+        The task inherits the caller's context (e.g. its outbound lane).
+        """
+        if address in self.walks:
+            return
+        if len(self.walks) >= self.max_pending_walks:
+            self.stats['walks_dropped'] += 1
+            return
+        task = asyncio.create_task(self._walk(address))
+        self.walks[address] = task
+        task.add_done_callback(lambda _: self.walks.pop(address, None))
+
+    async def _walk(self, address: str):
+        async with self.walk_slot:
+            self.stats['walks'] += 1
+            try:
+                await self.refresh(address)
+            except Exception as e:
+                print(f"Error walking history of {address}: {e!r}")
+
+    async def stop(self):
+        """Cancel queued and running background walks"""
+        walks = list(self.walks.values())
+        for task in walks:
+            task.cancel()
+        await asyncio.gather(*walks, return_exceptions=True)
+
+    def snapshot(self) -> list:
+        return [[address, cursor.to_dict()] for address, cursor in self.cursors.items()]
+
+    def restore(self, items: list):
+        """Reload saved cursors; cursors walked since startup are newer and kept"""
+        for address, data in items:
+            if address not in self.cursors:
+                self._store_cursor(address, HistoryCursor.from_dict(data))
@@ -0,0 +1,149 @@
+import time
+from bisect import bisect_right
+from typing import NamedTuple
+
+from price_cache import StaleWhileRevalidateCache
+from tx_analysis import bucket_sums, load_numpy
+
+# Outputs below this many satoshis are dust (Bitcoin Core's limit for P2PKH)
+DUST_LIMIT = 546
+
+# Upper bounds (exclusive, in satoshis) of the size classes; the last class is open-ended
+SIZE_CLASS_BOUNDS = (DUST_LIMIT, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000, 1_000_000_000)
+SIZE_CLASS_LABELS = ('dust', '<0.0001', '<0.001', '<0.01', '<0.1', '<1', '<10', '≥10')
+
+# Upper bounds (exclusive, in seconds) of the age buckets of confirmed UTXOs
+AGE_BUCKET_BOUNDS = (86400, 7 * 86400, 30 * 86400, 365 * 86400)
+AGE_BUCKET_LABELS = ('<1d', '<1w', '<1m', '<1y', '≥1y')
+
+# Virtual size of spending one input, by the type of the address that holds it
+INPUT_VBYTES = {'p2pkh': 148, 'p2sh': 91, 'p2wpkh': 68, 'p2wsh': 105, 'p2tr': 58}
+OUTPUT_VBYTES = {'p2pkh': 34, 'p2sh': 32, 'p2wpkh': 31, 'p2wsh': 43, 'p2tr': 43}
+TX_OVERHEAD_VBYTES = 11
+
+
+def _class_counts(values, block_times, now: float):
+    """One pass over the columns: per size class and age bucket counts and sums"""
+    size_count = [0] * len(SIZE_CLASS_LABELS)
+    size_value = [0] * len(SIZE_CLASS_LABELS)
+    age_count = [0] * len(AGE_BUCKET_LABELS)
+    age_value = [0] * len(AGE_BUCKET_LABELS)
+    unconfirmed_count = unconfirmed_value = 0
+    for value, block_time in zip(values, block_times):
+        size_class = bisect_right(SIZE_CLASS_BOUNDS, value)
+        size_count[size_class] += 1
+        size_value[size_class] += value
+        if block_time:
+            bucket = bisect_right(AGE_BUCKET_BOUNDS, now - block_time)
+            age_count[bucket] += 1
+            age_value[bucket] += value
+        else:
+            unconfirmed_count += 1
+            unconfirmed_value += value
+    return size_count, size_value, age_count, age_value, unconfirmed_count, unconfirmed_value
+
+
+def _class_counts_numpy(values, block_times, now: float):
+    numpy = load_numpy()
+    np_values = numpy.asarray(values, dtype=numpy.int64)
+    np_times = numpy.asarray(block_times, dtype=numpy.int64)
+    size_classes = numpy.searchsorted(SIZE_CLASS_BOUNDS, np_values, side='right')
+    size_count = numpy.bincount(size_classes, minlength=len(SIZE_CLASS_LABELS))
+    size_value = bucket_sums(size_classes, np_values, len(SIZE_CLASS_LABELS))
+
+    confirmed = np_times != 0
+    buckets = numpy.searchsorted(AGE_BUCKET_BOUNDS, now - np_times[confirmed], side='right')
+    age_count = numpy.bincount(buckets, minlength=len(AGE_BUCKET_LABELS))
+    age_value = bucket_sums(buckets, np_values[confirmed], len(AGE_BUCKET_LABELS))
+
+    unconfirmed_values = np_values[~confirmed]
+    return (
+        size_count.tolist(), size_value.tolist(),
+        age_count.tolist(), age_value.tolist(),
+        len(unconfirmed_values), int(unconfirmed_values.sum())
+    )
+
+
+def consolidation_estimate(values, address_type: str, fee_rate: float) -> dict:
+    """Size and fee of sweeping every UTXO into one output of the same type
+
+    `uneconomical` counts the UTXOs that cost more to spend at `fee_rate`
+    (sat/vB) than they hold.
+    """
+    input_vbytes = INPUT_VBYTES.get(address_type, INPUT_VBYTES['p2pkh'])
+    vbytes = TX_OVERHEAD_VBYTES + len(values) * input_vbytes + OUTPUT_VBYTES.get(address_type, OUTPUT_VBYTES['p2pkh'])
+    input_cost = input_vbytes * fee_rate
+    numpy = load_numpy()
+    if numpy is not None and len(values):
+        uneconomical = int(numpy.count_nonzero(numpy.asarray(values, dtype=numpy.int64) < input_cost))
+    else:
+        uneconomical = sum(1 for value in values if value < input_cost)
+    return {
+        'fee_rate': fee_rate,
+        'vbytes': vbytes,
+        'fee': int(vbytes * fee_rate),
+        'uneconomical': uneconomical
+    }
+
+
+def summarize_utxos(values, block_times, address_type: str = None, fee_rate: float = None, now: float = None) -> dict:
+    """Size-class histogram, dust, confirmation and age breakdown of a UTXO set
+
+    `values` and `block_times` are the UtxoCollector columns (block time 0
+    while unconfirmed); plain lists work too. With a `fee_rate` (sat/vB)
+    the result also has a consolidation estimate.
+    """
+    now = time.time() if now is None else now
+    count_by = _class_counts_numpy if load_numpy() is not None and len(values) else _class_counts
+    size_count, size_value, age_count, age_value, unconfirmed_count, unconfirmed_value = count_by(
+        values, block_times, now
+    )
+    total_value = sum(size_value)
+    return {
+        'count': len(values),
+        'total_value': total_value,
+        'size_classes': [
+            {'label': label, 'count': count, 'value': value}
+            for label, count, value in zip(SIZE_CLASS_LABELS, size_count, size_value)
+        ],
+        'dust_count': size_count[0],
+        'confirmed': {'count': len(values) - unconfirmed_count, 'value': total_value - unconfirmed_value},
+        'unconfirmed': {'count': unconfirmed_count, 'value': unconfirmed_value},
+        'ages': [
+            {'label': label, 'count': count, 'value': value}
+            for label, count, value in zip(AGE_BUCKET_LABELS, age_count, age_value)
+        ],
+        'consolidation': consolidation_estimate(values, address_type, fee_rate) if fee_rate else None
+    }
+
+
+class FeeEstimates(NamedTuple):
+    """A `/fee-estimates` snapshot (confirmation target in blocks -> sat/vB) and when it was fetched"""
+    rates: dict
+    fetched_at: float
+
+
+class FeeEstimateCache(StaleWhileRevalidateCache):
+    """Cached fee estimates; an expired snapshot keeps being served while it is refreshed
+
+    Failed refreshes keep the last snapshot.
+    """
+    entry_type = FeeEstimates
+    label = 'fee estimates'
+
+    def __init__(self, fetcher, ttl: float):
+        super().__init__(fetcher, ttl, stale_ttl=float('inf'))
+
+    def make_entry(self, data: dict, fetched_at: float):
+        if not data:
+            return None
+        return FeeEstimates({int(target): float(rate) for target, rate in data.items()}, fetched_at)
+
+    async def rate_for(self, target_blocks: int):
+        """Fee rate to confirm within `target_blocks`: the closest target that is not slower"""
+        estimates = await self.get()
+        if estimates is None or not estimates.rates:
+            return None
+        targets = sorted(estimates.rates)
+        index = bisect_right(targets, target_blocks) - 1
+        return estimates.rates[targets[max(index, 0)]]
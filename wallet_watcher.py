@@ -0,0 +1,236 @@
+import asyncio
+import time
+from collections import defaultdict
+
+# Esplora returns block transactions in pages of 25
+BLOCK_PAGE_SIZE = 25
+
+
+class WalletWatcher:
+    """Watches addresses for new activity on behalf of chat subscribers
+
+    Change detection is batched so its cost does not grow with the number
+    of watched addresses:
+
+    * the chain tip hash is polled once per tick; for every new block the
+      block's transactions are scanned once and matched against the whole
+      watch set with a set lookup;
+    * a round-robin sweep compares the cheap `/address` stats (chain and
+      mempool tx counts) of a bounded slice of addresses per tick, which
+      catches mempool activity and anything missed while offline.
+
+    Only addresses that changed are fetched again and reported. If the
+    watcher falls more than `max_block_catchup` blocks behind, it skips the
+    block scan and leaves catching up to the sweep.
+
+    `fetch_json`, `fetch_raw` and `fetch_stream` are the chain API helpers
+    of BitcoinAnalyzer; `notify(chat_id, address, old, new)` delivers a
+    notification; `on_change(address)` lets the caller drop cached data.
+    `load_subscriptions()`, if given, returns every (chat_id, address) pair
+    from shared storage; before each tick the watcher applies what changed
+    there since the last load, so one process can poll on behalf of others.
+    """
+
+    def __init__(self, fetch_json, fetch_raw, fetch_stream, notify, on_change=None,
+                 poll_interval: float = 30, sweep_batch: int = 25, concurrency: int = 4,
+                 max_block_catchup: int = 3, load_subscriptions=None):
+        self.fetch_json = fetch_json
+        self.fetch_raw = fetch_raw
+        self.fetch_stream = fetch_stream
+        self.notify = notify
+        self.on_change = on_change
+        self.load_subscriptions = load_subscriptions
+        self.loaded_subscriptions = set()
+        self.poll_interval = poll_interval
+        self.sweep_batch = sweep_batch
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_block_catchup = max_block_catchup
+        self.subscribers = defaultdict(set)   # address -> chat ids
+        self.watching = defaultdict(set)      # chat id -> addresses
+        self.snapshots = {}                   # address -> (chain_tx_count, mempool_tx_count, balance)
+        self.sweep_order = []
+        self.sweep_position = 0
+        self.tip_hash = None
+        self.task = None
+        self.stats = {'ticks': 0, 'blocks_scanned': 0, 'block_pages': 0, 'swept': 0, 'changes': 0, 'notifications': 0}
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self, chat_id: int, address: str) -> bool:
+        """Add a subscription; returns False if it already existed"""
+        if address in self.watching[chat_id]:
+            return False
+        if address not in self.subscribers:
+            self.sweep_order.append(address)
+        self.subscribers[address].add(chat_id)
+        self.watching[chat_id].add(address)
+        return True
+
+    def unsubscribe(self, chat_id: int, address: str) -> bool:
+        if address not in self.watching.get(chat_id, ()):
+            return False
+        self.watching[chat_id].discard(address)
+        if not self.watching[chat_id]:
+            del self.watching[chat_id]
+        self.subscribers[address].discard(chat_id)
+        if not self.subscribers[address]:
+            del self.subscribers[address]
+            self.snapshots.pop(address, None)
+            self.sweep_order.remove(address)
+        return True
+
+    def addresses_for(self, chat_id: int) -> list:
+        return sorted(self.watching.get(chat_id, ()))
+
+    @staticmethod
+    def snapshot_of(address_data: dict) -> tuple:
+        chain_stats = address_data.get('chain_stats', {})
+        mempool_stats = address_data.get('mempool_stats', {})
+        balance = (
+            chain_stats.get('funded_txo_sum', 0) - chain_stats.get('spent_txo_sum', 0)
+            + mempool_stats.get('funded_txo_sum', 0) - mempool_stats.get('spent_txo_sum', 0)
+        )
+        return (chain_stats.get('tx_count', 0), mempool_stats.get('tx_count', 0), balance)
+
+    async def check_address(self, address: str):
+        """Compare an address's stats with its last snapshot and report changes"""
+        async with self.semaphore:
+            address_data = await self.fetch_json('watch_address', f"/address/{address}")
+        if address_data is None or address not in self.subscribers:
+            return
+        new = self.snapshot_of(address_data)
+        old = self.snapshots.get(address)
+        self.snapshots[address] = new
+        if old is None or old == new:
+            return
+        self.stats['changes'] += 1
+        if self.on_change is not None:
+            self.on_change(address)
+        for chat_id in list(self.subscribers.get(address, ())):
+            try:
+                await self.notify(chat_id, address, old, new)
+                self.stats['notifications'] += 1
+            except Exception as e:
+                print(f"Error notifying {chat_id}: {e}")
+
+    async def _scan_block_page(self, block_hash: str, start: int) -> set:
+        watched = self.subscribers
+
+        async def consume(items):
+            touched = set()
+            async for tx in items:
+                for vout in tx.get('vout', ()):
+                    if vout.get('scriptpubkey_address') in watched:
+                        touched.add(vout['scriptpubkey_address'])
+                for vin in tx.get('vin', ()):
+                    prevout = vin.get('prevout') or {}
+                    if prevout.get('scriptpubkey_address') in watched:
+                        touched.add(prevout['scriptpubkey_address'])
+            return touched
+
+        async with self.semaphore:
+            touched = await self.fetch_stream('watch_block', f"/block/{block_hash}/txs/{start}", consume)
+        self.stats['block_pages'] += 1
+        return touched or set()
+
+    async def scan_block(self, block: dict) -> set:
+        """Watched addresses touched by any transaction of `block`"""
+        pages = await asyncio.gather(*[
+            self._scan_block_page(block['id'], start)
+            for start in range(0, block.get('tx_count', 0), BLOCK_PAGE_SIZE)
+        ])
+        self.stats['blocks_scanned'] += 1
+        return set().union(*pages)
+
+    async def _new_blocks(self, tip_hash: str):
+        """Headers of blocks since the last seen tip (None if too far behind to scan)"""
+        blocks = []
+        block_hash = tip_hash
+        while block_hash and block_hash != self.tip_hash:
+            if len(blocks) >= self.max_block_catchup:
+                return None
+            block = await self.fetch_json('watch_block', f"/block/{block_hash}")
+            if block is None:
+                break
+            blocks.append(block)
+            block_hash = block.get('previousblockhash')
+        return blocks
+
+    async def sync_subscriptions(self):
+        """Apply subscriptions added or removed in shared storage since the last load
+
+        Only the difference between two loads is applied, so local changes
+        not yet written to the storage are left alone.
+        """
+        loaded = {(chat_id, address) for chat_id, address in await self.load_subscriptions()}
+        for chat_id, address in loaded - self.loaded_subscriptions:
+            self.subscribe(chat_id, address)
+        for chat_id, address in self.loaded_subscriptions - loaded:
+            self.unsubscribe(chat_id, address)
+        self.loaded_subscriptions = loaded
+
+    async def tick(self):
+        """One polling round: new blocks first, then a slice of the sweep"""
+        if self.load_subscriptions is not None:
+            await self.sync_subscriptions()
+        if not self.subscribers:
+            return
+        self.stats['ticks'] += 1
+        to_check = set()
+
+        tip_hash = await self.fetch_raw('watch_tip', "/blocks/tip/hash")
+        tip_hash = tip_hash.decode().strip() if tip_hash else None
+        if tip_hash and tip_hash != self.tip_hash:
+            if self.tip_hash is not None:
+                blocks = await self._new_blocks(tip_hash)
+                for block in blocks or ():
+                    to_check.update(await self.scan_block(block))
+            self.tip_hash = tip_hash
+
+        for _ in range(min(self.sweep_batch, len(self.sweep_order))):
+            self.sweep_position %= len(self.sweep_order)
+            to_check.add(self.sweep_order[self.sweep_position])
+            self.sweep_position += 1
+            self.stats['swept'] += 1
+
+        await asyncio.gather(*[self.check_address(address) for address in to_check], return_exceptions=True)
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Error polling watched addresses: {e}")
+            await asyncio.sleep(max(self.poll_interval - (time.monotonic() - started), 1))
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def snapshot(self) -> dict:
+        """Last seen stats and tip; subscriptions are persisted one by one by the caller"""
+        return {
+            'snapshots': {address: list(values) for address, values in self.snapshots.items()},
+            'tip_hash': self.tip_hash
+        }
+
+    def restore(self, data: dict):
+        """Reload a snapshot; call after the subscriptions have been restored"""
+        for address, values in data.get('snapshots', {}).items():
+            if address in self.subscribers:
+                self.snapshots[address] = tuple(values)
+        self.tip_hash = data.get('tip_hash')
+
+    def summary(self) -> dict:
+        return dict(self.stats, addresses=len(self.subscribers), chats=len(self.watching), tip_hash=self.tip_hash)